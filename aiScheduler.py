@@ -0,0 +1,121 @@
+import heapq
+
+class AIScheduler():
+    """
+    Level of detail for the NPCs' AI, by room.
+
+    NPCs in a room the player is in are active and tick every frame. The rest are
+    inactive: they tick inactiveRate times a second, or not at all if sleepInactive
+    is set, until playerEnteredRoom wakes their room. The inactive NPCs wait in a
+    heap ordered by when they're next due, so a frame only touches the active NPCs
+    and the inactive ones that are due, however many rooms there are.
+
+    If isBusy is given, an inactive NPC for which isBusy(npc) is true, such as one
+    carrying its key home, keeps ticking every frame until it isn't busy any more.
+
+    update() is called once a frame and returns (npc, elapsedTime, missedFrames)
+    for every NPC to tick. elapsedTime is the time since it last ticked, so a slow
+    tick covers the time it skipped, except that an NPC waking up starts from the
+    frame it woke in. missedFrames counts the frames since then that it didn't
+    tick, for catching its state up (see NPC.catchUpWander).
+    """
+
+    def __init__(self, inactiveRate = 2.0, sleepInactive = False, isBusy = None):
+        self.inactiveRate = inactiveRate
+        self.sleepInactive = sleepInactive
+        self.isBusy = isBusy
+        self.rooms = {}
+        self.activeRooms = set()
+        # NPCs ticking every frame, in the order they were added
+        self.active = []
+        # NPCs in inactive rooms that tick every frame while they're busy
+        self.busy = []
+        # (next tick time, order, generation, npc) for NPCs ticking at inactiveRate
+        self.throttled = []
+        self.order = {}
+        self.generations = {}
+        # npc:(time, frame) it last ticked
+        self.lastTicks = {}
+        self.time = 0.0
+        self.frame = 0
+
+    def addNPC(self, npc, room):
+        """Adds npc, which lives in room. Rooms start inactive until playerEnteredRoom."""
+        self.rooms.setdefault(room, []).append(npc)
+        self.order[npc] = len(self.order)
+        self.generations[npc] = 0
+        self.lastTicks[npc] = (self.time, self.frame)
+        if room in self.activeRooms:
+            self.active.append(npc)
+            self.active.sort(key = self.order.get)
+        else:
+            self.deactivate(npc)
+
+    def playerEnteredRoom(self, room):
+        """
+        Wakes room's NPCs. Returns (npc, missedFrames) for each, so they can be caught
+        up before anything changes their state. They start afresh from here.
+        """
+        if room in self.activeRooms:
+            return []
+        self.activeRooms.add(room)
+        woken = []
+        entering = set(self.rooms.get(room, ()))
+        self.busy = [npc for npc in self.busy if npc not in entering]
+        for npc in self.rooms.get(room, ()):
+            #Its place in the heap, if any, is now stale
+            self.generations[npc] += 1
+            self.active.append(npc)
+            woken.append((npc, self.frame - self.lastTicks[npc][1]))
+            #It picks up from here rather than moving for all the time it was away
+            self.lastTicks[npc] = (self.time, self.frame)
+        self.active.sort(key = self.order.get)
+        return woken
+
+    def playerLeftRoom(self, room):
+        if room not in self.activeRooms:
+            return
+        self.activeRooms.discard(room)
+        leaving = set(self.rooms.get(room, ()))
+        self.active = [npc for npc in self.active if npc not in leaving]
+        for npc in self.rooms.get(room, ()):
+            self.deactivate(npc)
+
+    def deactivate(self, npc):
+        self.generations[npc] += 1
+        if self.isBusy is not None and self.isBusy(npc):
+            self.busy.append(npc)
+        elif not self.sleepInactive and self.inactiveRate > 0:
+            heapq.heappush(self.throttled, (self.time + 1.0 / self.inactiveRate, self.order[npc],
+                                            self.generations[npc], npc))
+
+    def update(self, elapsedTime):
+        """Moves the clock on a frame and returns the (npc, elapsedTime, missedFrames) to tick, active ones first."""
+        self.time += elapsedTime
+        self.frame += 1
+        due = list(self.active)
+        #Busy NPCs tick until they're done, and then go the way of the rest of their room
+        busy = self.busy
+        self.busy = []
+        for npc in busy:
+            if self.isBusy(npc):
+                self.busy.append(npc)
+                due.append(npc)
+            else:
+                self.deactivate(npc)
+        while self.throttled and self.throttled[0][0] <= self.time:
+            nextTick, order, generation, npc = heapq.heappop(self.throttled)
+            if generation != self.generations[npc]:
+                continue
+            due.append(npc)
+            #Keep to the rate, but don't try to make up ticks a long frame skipped
+            nextTick += 1.0 / self.inactiveRate
+            if nextTick <= self.time:
+                nextTick = self.time + 1.0 / self.inactiveRate
+            heapq.heappush(self.throttled, (nextTick, order, generation, npc))
+        ticks = []
+        for npc in due:
+            lastTime, lastFrame = self.lastTicks[npc]
+            ticks.append((npc, self.time - lastTime, self.frame - lastFrame - 1))
+            self.lastTicks[npc] = (self.time, self.frame)
+        return ticks
@@ -0,0 +1,93 @@
+from array import array
+import math
+from pathScheduler import PathSearch, DONE
+
+class CompactGraph():
+    """
+    A waypoint graph stored as flat arrays instead of NodePaths.
+
+    positions holds x and y for each node ID, one after the other, as 32 bit
+    floats. The neighbors of node i are neighborIDs[offsets[i]:offsets[i + 1]],
+    and lengths holds the length of each of those edges, measured once when the
+    graph is built (compressed sparse row adjacency). A 100k node graph with a
+    handful of edges per node takes a few MB, and searching it never touches
+    the scene graph.
+
+    The arrays are never changed once the graph is built, so a CompactGraph can
+    be shared with other threads. Build a new one when the waypoints change.
+    """
+
+    def __init__(self, positions, adjacency, lengths = None):
+        """
+        positions is a list of (x, y) and adjacency a list of neighbor ID lists,
+        both indexed by node ID. lengths, in the same shape as adjacency, defaults
+        to the straight line distance between the nodes.
+        """
+        self.nodeCount = len(positions)
+        self.positions = array('f')
+        for x, y in positions:
+            self.positions.append(x)
+            self.positions.append(y)
+        self.offsets = array('i', [0])
+        self.neighborIDs = array('i')
+        self.lengths = array('f')
+        for nodeID in range(self.nodeCount):
+            for i in range(len(adjacency[nodeID])):
+                neighborID = adjacency[nodeID][i]
+                self.neighborIDs.append(neighborID)
+                if lengths is None:
+                    self.lengths.append(self.distanceBetween(nodeID, neighborID))
+                else:
+                    self.lengths.append(lengths[nodeID][i])
+            self.offsets.append(len(self.neighborIDs))
+
+    @classmethod
+    def fromWaypoints(self, waypoints, position, distance):
+        """
+        Builds the graph for a list of Waypoints, using their IDs as node IDs.
+        position(waypoint) gives its (x, y) and distance(a, b) an edge's length.
+        IDs that no waypoint uses become nodes with no edges.
+        """
+        nodeCount = max([waypoint.ID for waypoint in waypoints]) + 1
+        positions = [(0.0, 0.0)] * nodeCount
+        adjacency = [[] for i in range(nodeCount)]
+        lengths = [[] for i in range(nodeCount)]
+        for waypoint in waypoints:
+            positions[waypoint.ID] = position(waypoint)
+            for neighbor in waypoint.getNeighbors():
+                adjacency[waypoint.ID].append(neighbor.ID)
+                lengths[waypoint.ID].append(distance(waypoint, neighbor))
+        return self(positions, adjacency, lengths)
+
+    def getPosition(self, nodeID):
+        return (self.positions[2 * nodeID], self.positions[2 * nodeID + 1])
+
+    def getNeighborIDs(self, nodeID):
+        return self.neighborIDs[self.offsets[nodeID]:self.offsets[nodeID + 1]]
+
+    def getEdges(self, nodeID):
+        """Returns a list of (neighborID, length) for the edges leaving nodeID."""
+        return [(self.neighborIDs[edge], self.lengths[edge])
+                for edge in range(self.offsets[nodeID], self.offsets[nodeID + 1])]
+
+    def distanceBetween(self, nodeID, otherID):
+        return math.hypot(self.positions[2 * otherID] - self.positions[2 * nodeID],
+                          self.positions[2 * otherID + 1] - self.positions[2 * nodeID + 1])
+
+    def distanceTo(self, nodeID, x, y):
+        return math.hypot(self.positions[2 * nodeID] - x, self.positions[2 * nodeID + 1] - y)
+
+    def findPath(self, sourceID, targetID):
+        """Returns the list of node IDs from source to target, both included, or None."""
+        search = PathSearch(self, sourceID, targetID)
+        if search.step(self.nodeCount + 1) != DONE:
+            return None
+        return search.pathIDs
+
+    def getEdgeCount(self):
+        return len(self.neighborIDs)
+
+    def getMemoryUsage(self):
+        """Bytes used by the graph's arrays."""
+        return sum([len(values) * values.itemsize
+                    for values in (self.positions, self.offsets, self.neighborIDs, self.lengths)])
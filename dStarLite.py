@@ -0,0 +1,169 @@
+import heapq
+
+class DStarLite():
+    """
+    Incremental path planner over a WaypointGraph, after Koenig and Likhachev's
+    D* Lite. It searches backward from the goal and keeps its search tree between
+    calls, so when the agent moves only the key modifier changes.
+
+    The goal is handled as an extra virtual node that the goal waypoint links to
+    with zero cost. When the goal's waypoint changes, that is just two edge cost
+    changes, and only the part of the tree that depended on them is repaired
+    instead of searching from scratch.
+    """
+
+    # The edge lengths are 32 bit floats while the heuristic is measured in 64 bits,
+    # so it is scaled down a little to never beat an edge by a rounding error.
+    # A heuristic that does makes computeShortestPath stop early on near ties.
+    heuristicScale = 1 - 1E-5
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.expanded = 0
+        self.reset()
+
+    def reset(self):
+        graph = self.graph
+        if not graph.isValid:
+            graph.build()
+        self.version = graph.version
+        compact = graph.compact
+        self.nodeCount = compact.nodeCount
+        self.virtualGoal = self.nodeCount
+        self.compact = compact
+        self.successors = [compact.getEdges(nodeID) for nodeID in range(self.nodeCount)]
+        self.predecessors = [[] for i in range(self.nodeCount)]
+        for nodeID in range(self.nodeCount):
+            for neighborID, cost in self.successors[nodeID]:
+                self.predecessors[neighborID].append((nodeID, cost))
+        self.startID = None
+        self.goalID = None
+
+    def heuristic(self, fromID, toID):
+        if toID == self.virtualGoal:
+            return 0
+        return self.compact.distanceBetween(fromID, toID) * self.heuristicScale
+
+    def getSuccessors(self, nodeID):
+        if nodeID == self.goalID:
+            return self.successors[nodeID] + [(self.virtualGoal, 0)]
+        return self.successors[nodeID]
+
+    def getPredecessors(self, nodeID):
+        if nodeID == self.virtualGoal:
+            return [(self.goalID, 0)]
+        return self.predecessors[nodeID]
+
+    def calculateKey(self, nodeID):
+        best = min(self.g[nodeID], self.rhs[nodeID])
+        return (best + self.heuristic(self.startID, nodeID) + self.km, best)
+
+    def initialize(self, startID, goalID):
+        infinity = 1E400
+        self.startID = startID
+        self.goalID = goalID
+        self.km = 0
+        self.g = [infinity] * (self.nodeCount + 1)
+        self.rhs = [infinity] * (self.nodeCount + 1)
+        self.rhs[self.virtualGoal] = 0
+        #Entries are (key, nodeID). queuedKeys holds each node's current key so stale entries can be skipped.
+        self.openSet = []
+        self.queuedKeys = [None] * (self.nodeCount + 1)
+        self.updateVertex(self.virtualGoal)
+
+    def updateVertex(self, nodeID):
+        if self.g[nodeID] != self.rhs[nodeID]:
+            key = self.calculateKey(nodeID)
+            self.queuedKeys[nodeID] = key
+            heapq.heappush(self.openSet, (key, nodeID))
+        else:
+            self.queuedKeys[nodeID] = None
+
+    def updateRhs(self, nodeID):
+        if nodeID == self.virtualGoal:
+            return
+        best = 1E400
+        for neighborID, cost in self.getSuccessors(nodeID):
+            if cost + self.g[neighborID] < best:
+                best = cost + self.g[neighborID]
+        self.rhs[nodeID] = best
+
+    def topKey(self):
+        while self.openSet:
+            key, nodeID = self.openSet[0]
+            if self.queuedKeys[nodeID] == key:
+                return key
+            heapq.heappop(self.openSet)
+        return (1E400, 1E400)
+
+    def computeShortestPath(self):
+        startID = self.startID
+        while self.topKey() < self.calculateKey(startID) or self.rhs[startID] != self.g[startID]:
+            if not self.openSet:
+                break
+            oldKey, nodeID = heapq.heappop(self.openSet)
+            self.expanded += 1
+            newKey = self.calculateKey(nodeID)
+            if oldKey < newKey:
+                self.queuedKeys[nodeID] = newKey
+                heapq.heappush(self.openSet, (newKey, nodeID))
+            elif self.g[nodeID] > self.rhs[nodeID]:
+                self.g[nodeID] = self.rhs[nodeID]
+                self.queuedKeys[nodeID] = None
+                for predecessorID, cost in self.getPredecessors(nodeID):
+                    if cost + self.g[nodeID] < self.rhs[predecessorID]:
+                        self.rhs[predecessorID] = cost + self.g[nodeID]
+                    self.updateVertex(predecessorID)
+            else:
+                oldG = self.g[nodeID]
+                self.g[nodeID] = 1E400
+                for predecessorID, cost in self.getPredecessors(nodeID) + [(nodeID, 0)]:
+                    if predecessorID == nodeID or self.rhs[predecessorID] == cost + oldG:
+                        self.updateRhs(predecessorID)
+                    self.updateVertex(predecessorID)
+
+    def changeGoal(self, goalID):
+        oldGoalID = self.goalID
+        self.goalID = goalID
+        #The old goal lost its free edge to the virtual goal and the new one gained one
+        self.updateRhs(oldGoalID)
+        self.updateVertex(oldGoalID)
+        self.updateRhs(goalID)
+        self.updateVertex(goalID)
+
+    def plan(self, source, target):
+        """
+        Returns the list of waypoints from source to target, both included, or
+        None if target can't be reached.
+        """
+        if self.version != self.graph.version or not self.graph.isValid:
+            self.reset()
+        if self.startID is None:
+            self.initialize(source.ID, target.ID)
+        else:
+            if source.ID != self.startID:
+                self.km += self.heuristic(self.startID, source.ID)
+                self.startID = source.ID
+            if target.ID != self.goalID:
+                self.changeGoal(target.ID)
+        self.computeShortestPath()
+
+        if self.g[self.startID] == 1E400:
+            return None
+        waypointsByID = self.graph.waypointsByID
+        nodeID = self.startID
+        path = [waypointsByID[nodeID]]
+        while nodeID != self.goalID and len(path) <= self.nodeCount:
+            bestID = None
+            best = 1E400
+            for neighborID, cost in self.successors[nodeID]:
+                if cost + self.g[neighborID] < best:
+                    best = cost + self.g[neighborID]
+                    bestID = neighborID
+            if bestID is None:
+                return None
+            nodeID = bestID
+            path.append(waypointsByID[nodeID])
+        if nodeID != self.goalID:
+            return None
+        return path
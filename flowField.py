@@ -0,0 +1,73 @@
+import heapq
+from array import array
+
+class FlowField():
+    """
+    The next waypoint to head for from every waypoint in a room, on the shortest
+    way to one goal waypoint. It is a single Dijkstra search backward from the
+    goal over the room's CompactGraph, so every agent chasing the same target
+    shares it and just reads its next hop.
+
+    setGoal only searches again when the goal waypoint (the target's cell) or
+    the graph changes, however many agents read the field.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.goalID = None
+        self.version = None
+        self.nextIDs = array('i')
+        self.costs = array('f')
+        self.computeCount = 0
+
+    def setGoal(self, goalID):
+        """Returns True if the field had to be computed again."""
+        graph = self.graph
+        if not graph.isValid:
+            graph.build()
+        if goalID == self.goalID and graph.version == self.version:
+            return False
+        self.goalID = goalID
+        self.version = graph.version
+        self.compute()
+        return True
+
+    def compute(self):
+        infinity = 1E400
+        compact = self.graph.compact
+        nodeCount = compact.nodeCount
+        #Search the edges backward, since we want the way to the goal from everywhere
+        predecessors = [[] for i in range(nodeCount)]
+        for nodeID in range(nodeCount):
+            for edge in range(compact.offsets[nodeID], compact.offsets[nodeID + 1]):
+                predecessors[compact.neighborIDs[edge]].append((nodeID, compact.lengths[edge]))
+
+        costs = [infinity] * nodeCount
+        nextIDs = array('i', [-1]) * nodeCount
+        if self.goalID is not None:
+            costs[self.goalID] = 0
+            nextIDs[self.goalID] = self.goalID
+            openSet = [(0, self.goalID)]
+            while openSet:
+                currentCost, currentID = heapq.heappop(openSet)
+                if currentCost > costs[currentID]:
+                    continue
+                for predecessorID, length in predecessors[currentID]:
+                    predecessorCost = currentCost + length
+                    if predecessorCost < costs[predecessorID]:
+                        costs[predecessorID] = predecessorCost
+                        nextIDs[predecessorID] = currentID
+                        heapq.heappush(openSet, (predecessorCost, predecessorID))
+        self.nextIDs = nextIDs
+        self.costs = array('f', costs)
+        self.computeCount += 1
+
+    def getNextID(self, nodeID):
+        """The next node on the way to the goal, the goal itself once there, or -1 if it can't be reached."""
+        return self.nextIDs[nodeID]
+
+    def getNextWaypoint(self, waypoint):
+        nextID = self.nextIDs[waypoint.ID]
+        if nextID == -1:
+            return None
+        return self.graph.waypointsByID[nextID]
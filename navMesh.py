@@ -0,0 +1,379 @@
+"""
+Navigation meshes for the rooms.
+
+Run this file to rebuild them from the room models:
+
+    python navMesh.py rooms/room1.egg rooms/room2.egg rooms/room3.egg
+
+Each rooms/roomN.egg gets a rooms/roomN.nav next to it. The builder reads the
+walls out of the egg file, rasterizes the floor minus the walls (and a little
+clearance around them) and merges the walkable cells into rectangles, which
+are the mesh's convex polygons. NavMesh loads them at runtime, finds the
+corridor of polygons between two points with A* and pulls the path tight
+through it with the funnel algorithm.
+"""
+import heapq
+import math
+import re
+import sys
+
+navMeshFormat = "navmesh 1"
+
+def readEggPolygons(fileName):
+    """Returns every polygon in an egg file as a list of (x, y, z) corners."""
+    text = open(fileName).read()
+    pools = {}
+    pool = None
+    #Vertices belong to the last vertex pool opened before them
+    for match in re.finditer(r"<VertexPool>\s*(\S+)\s*\{|<Vertex>\s*(\d+)\s*\{\s*(\S+)\s+(\S+)\s+(\S+)", text):
+        if match.group(1) is not None:
+            pool = pools.setdefault(match.group(1), {})
+        else:
+            pool[int(match.group(2))] = (float(match.group(3)), float(match.group(4)), float(match.group(5)))
+    polygons = []
+    for match in re.finditer(r"<VertexRef>\s*\{([\d\s]*)<Ref>\s*\{\s*([^\s}]+)\s*\}", text):
+        pool = pools[match.group(2)]
+        polygons.append([pool[int(index)] for index in match.group(1).split()])
+    return polygons
+
+def isHorizontal(polygon):
+    #Newell's method for the polygon's normal
+    normalX = normalY = normalZ = 0.0
+    for i in range(len(polygon)):
+        x1, y1, z1 = polygon[i]
+        x2, y2, z2 = polygon[(i + 1) % len(polygon)]
+        normalX += (y1 - y2) * (z1 + z2)
+        normalY += (z1 - z2) * (x1 + x2)
+        normalZ += (x1 - x2) * (y1 + y2)
+    length = math.sqrt(normalX * normalX + normalY * normalY + normalZ * normalZ)
+    return length > 0 and abs(normalZ) / length > 0.9
+
+def pointInPolygon(x, y, polygon):
+    inside = False
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[i - 1]
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+def distanceToSegment(x, y, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    lengthSquared = dx * dx + dy * dy
+    t = 0.0
+    if lengthSquared > 0:
+        t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / lengthSquared))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+def getWallFootprints(wallPolygons):
+    """The walls' footprints on the floor, taken from their horizontal faces."""
+    return [[(x, y) for x, y, z in polygon] for polygon in wallPolygons if isHorizontal(polygon)]
+
+def isWalkable(x, y, footprints, clearance):
+    """True if (x, y) is outside every footprint and at least clearance from all of them."""
+    for footprint in footprints:
+        if pointInPolygon(x, y, footprint):
+            return False
+        for i in range(len(footprint)):
+            x1, y1 = footprint[i - 1]
+            x2, y2 = footprint[i]
+            if distanceToSegment(x, y, x1, y1, x2, y2) < clearance:
+                return False
+    return True
+
+def buildNavMesh(wallPolygons, floor = (-9.0, -9.0, 9.0, 9.0), cellSize = 0.25, clearance = 0.3):
+    """
+    Returns the convex polygons, as lists of (x, y), that cover the floor rectangle
+    (minX, minY, maxX, maxY) except where the walls are. The walls' footprints come
+    from their horizontal faces, and cells closer than clearance to one are left out
+    too, so agents following the mesh don't scrape along the walls.
+    """
+    footprints = getWallFootprints(wallPolygons)
+    minX, minY, maxX, maxY = floor
+    columns = int(round((maxX - minX) / cellSize))
+    rows = int(round((maxY - minY) / cellSize))
+
+    walkable = []
+    for row in range(rows):
+        y = minY + (row + 0.5) * cellSize
+        walkable.append([isWalkable(minX + (column + 0.5) * cellSize, y, footprints, clearance)
+                         for column in range(columns)])
+
+    #Merge each row into runs of walkable cells, and grow a rectangle down while the same run continues
+    rectangles = []
+    openRuns = {}
+    for row in range(rows + 1):
+        runs = []
+        column = 0
+        while row < rows and column < columns:
+            if walkable[row][column]:
+                start = column
+                while column < columns and walkable[row][column]:
+                    column += 1
+                runs.append((start, column))
+            else:
+                column += 1
+        stillOpen = {}
+        for run in runs:
+            stillOpen[run] = openRuns.pop(run, row)
+        for (start, end), firstRow in openRuns.items():
+            rectangles.append((start, firstRow, end, row))
+        openRuns = stillOpen
+    rectangles.sort()
+
+    polygons = []
+    for startColumn, startRow, endColumn, endRow in rectangles:
+        x1, y1 = minX + startColumn * cellSize, minY + startRow * cellSize
+        x2, y2 = minX + endColumn * cellSize, minY + endRow * cellSize
+        polygons.append([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+    return polygons
+
+def writeNavMesh(fileName, polygons, source = ""):
+    navFile = open(fileName, "w")
+    navFile.write("# Navigation mesh for " + source + ", built by navMesh.py\n")
+    navFile.write(navMeshFormat + "\n")
+    for polygon in polygons:
+        navFile.write("polygon " + " ".join(["%g %g" % point for point in polygon]) + "\n")
+    navFile.close()
+
+def readNavMesh(fileName):
+    """Returns the polygons in a file written by writeNavMesh."""
+    lines = [line.strip() for line in open(fileName) if line.strip() and not line.startswith("#")]
+    if not lines or lines[0] != navMeshFormat:
+        raise ValueError(fileName + " is not a " + navMeshFormat + " file")
+    polygons = []
+    for line in lines[1:]:
+        values = [float(value) for value in line.split()[1:]]
+        polygons.append([(values[i], values[i + 1]) for i in range(0, len(values), 2)])
+    return polygons
+
+
+def signedArea(polygon):
+    area = 0.0
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[i]
+        area += x1 * y2 - x2 * y1
+    return area / 2.0
+
+def triangleArea2(a, b, c):
+    return (c[0] - a[0]) * (b[1] - a[1]) - (b[0] - a[0]) * (c[1] - a[1])
+
+def funnel(start, portals, end):
+    """
+    The simple stupid funnel algorithm. portals are the (left, right) edges crossed
+    on the way from start to end. Returns the corners of the shortest path through
+    them, ending with end and not including start.
+    """
+    portals = [(start, start)] + list(portals) + [(end, end)]
+    path = []
+    apex = left = right = start
+    apexIndex = leftIndex = rightIndex = 0
+    i = 1
+    while i < len(portals):
+        newLeft, newRight = portals[i]
+        #Try to narrow the funnel from the right
+        if triangleArea2(apex, right, newRight) <= 0.0:
+            if apex == right or triangleArea2(apex, left, newRight) > 0.0:
+                right = newRight
+                rightIndex = i
+            else:
+                #The right side crossed over the left, so the left is a corner
+                path.append(left)
+                apex = right = left
+                apexIndex = rightIndex = leftIndex
+                i = apexIndex + 1
+                continue
+        #Try to narrow the funnel from the left
+        if triangleArea2(apex, left, newLeft) >= 0.0:
+            if apex == left or triangleArea2(apex, right, newLeft) < 0.0:
+                left = newLeft
+                leftIndex = i
+            else:
+                path.append(right)
+                apex = left = right
+                apexIndex = leftIndex = rightIndex
+                i = apexIndex + 1
+                continue
+        i += 1
+    if not path or path[-1] != end:
+        path.append(end)
+    return path
+
+
+class NavMesh():
+    """
+    A set of convex polygons that cover where agents can walk, and the portals
+    (shared stretches of edge) between them. findPath searches the polygons with
+    A* and returns the corners of the shortest path through them, so the path is
+    already as smooth as it can be.
+    """
+
+    def __init__(self, polygons, tolerance = 0.01):
+        #Keep every polygon counterclockwise so the inside is on the left of each edge
+        self.polygons = []
+        for polygon in polygons:
+            polygon = [(float(x), float(y)) for x, y in polygon]
+            if signedArea(polygon) < 0:
+                polygon.reverse()
+            self.polygons.append(polygon)
+        self.bounds = [(min([x for x, y in polygon]), min([y for x, y in polygon]),
+                        max([x for x, y in polygon]), max([y for x, y in polygon])) for polygon in self.polygons]
+        self.centers = [(sum([x for x, y in polygon]) / len(polygon), sum([y for x, y in polygon]) / len(polygon))
+                        for polygon in self.polygons]
+        self.tolerance = tolerance
+        self.buildPortals()
+
+    def buildPortals(self):
+        """portals[i] lists (neighbor, left, right) for each stretch of edge polygon i shares."""
+        tolerance = self.tolerance
+        self.portals = [[] for polygon in self.polygons]
+        for i in range(len(self.polygons)):
+            minX, minY, maxX, maxY = self.bounds[i]
+            for j in range(i + 1, len(self.polygons)):
+                otherMinX, otherMinY, otherMaxX, otherMaxY = self.bounds[j]
+                if otherMinX > maxX + tolerance or otherMaxX < minX - tolerance or \
+                   otherMinY > maxY + tolerance or otherMaxY < minY - tolerance:
+                    continue
+                for k in range(len(self.polygons[i])):
+                    p = self.polygons[i][k]
+                    q = self.polygons[i][(k + 1) % len(self.polygons[i])]
+                    length = math.hypot(q[0] - p[0], q[1] - p[1])
+                    if length == 0:
+                        continue
+                    directionX, directionY = (q[0] - p[0]) / length, (q[1] - p[1]) / length
+                    for m in range(len(self.polygons[j])):
+                        r = self.polygons[j][m]
+                        s = self.polygons[j][(m + 1) % len(self.polygons[j])]
+                        #Shared edges run the opposite way along the same line
+                        if abs((r[0] - p[0]) * directionY - (r[1] - p[1]) * directionX) > tolerance or \
+                           abs((s[0] - p[0]) * directionY - (s[1] - p[1]) * directionX) > tolerance:
+                            continue
+                        tR = (r[0] - p[0]) * directionX + (r[1] - p[1]) * directionY
+                        tS = (s[0] - p[0]) * directionX + (s[1] - p[1]) * directionY
+                        if tR <= tS:
+                            continue
+                        low, high = max(0.0, tS), min(length, tR)
+                        if high - low <= tolerance:
+                            continue
+                        near = (p[0] + directionX * low, p[1] + directionY * low)
+                        far = (p[0] + directionX * high, p[1] + directionY * high)
+                        #Leaving i through this edge, far is on the left; leaving j, near is
+                        self.portals[i].append((j, far, near))
+                        self.portals[j].append((i, near, far))
+
+    def contains(self, index, x, y):
+        polygon = self.polygons[index]
+        for k in range(len(polygon)):
+            x1, y1 = polygon[k - 1]
+            x2, y2 = polygon[k]
+            if (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1) < -self.tolerance:
+                return False
+        return True
+
+    def closestPoint(self, index, x, y):
+        """The closest point to (x, y) in polygon index."""
+        if self.contains(index, x, y):
+            return (x, y)
+        polygon = self.polygons[index]
+        best = None
+        for k in range(len(polygon)):
+            x1, y1 = polygon[k - 1]
+            x2, y2 = polygon[k]
+            dx, dy = x2 - x1, y2 - y1
+            t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+            point = (x1 + t * dx, y1 + t * dy)
+            distance = math.hypot(point[0] - x, point[1] - y)
+            if best is None or distance < best[0]:
+                best = (distance, point)
+        return best[1]
+
+    def locate(self, x, y):
+        """
+        Returns (index, point): the polygon (x, y) is in and (x, y) itself, or the
+        closest polygon and the closest point in it when (x, y) is off the mesh.
+        """
+        best = None
+        for index in range(len(self.polygons)):
+            minX, minY, maxX, maxY = self.bounds[index]
+            if minX <= x <= maxX and minY <= y <= maxY and self.contains(index, x, y):
+                return index, (x, y)
+            #Nothing in the box can be closer than the box itself
+            boxDistance = math.hypot(max(minX - x, 0, x - maxX), max(minY - y, 0, y - maxY))
+            if best is not None and boxDistance >= best[0]:
+                continue
+            point = self.closestPoint(index, x, y)
+            distance = math.hypot(point[0] - x, point[1] - y)
+            if best is None or distance < best[0]:
+                best = (distance, index, point)
+        if best is None:
+            return None, None
+        return best[1], best[2]
+
+    def findPath(self, start, end):
+        """
+        Returns the corners of the shortest path from start to end, both (x, y), ending
+        with end, or None if end can't be reached. Points off the mesh are moved to the
+        closest point on it first.
+        """
+        startIndex, start = self.locate(start[0], start[1])
+        endIndex, end = self.locate(end[0], end[1])
+        if startIndex is None or endIndex is None:
+            return None
+        corridor = self.findCorridor(startIndex, start, endIndex, end)
+        if corridor is None:
+            return None
+        return funnel(start, corridor, end)
+
+    def findCorridor(self, startIndex, start, endIndex, end):
+        """
+        A* over the polygons, moving between the middles of the portals. Returns the
+        (left, right) portals crossed from startIndex to endIndex, or None.
+        """
+        infinity = 1E400
+        gScore = [infinity] * len(self.polygons)
+        entryPoints = [None] * len(self.polygons)
+        cameFrom = [None] * len(self.polygons)
+        closedSet = [False] * len(self.polygons)
+        gScore[startIndex] = 0
+        entryPoints[startIndex] = start
+        openSet = [(math.hypot(end[0] - start[0], end[1] - start[1]), startIndex)]
+        while openSet:
+            currentFScore, current = heapq.heappop(openSet)
+            if closedSet[current]:
+                continue
+            if current == endIndex:
+                corridor = []
+                while cameFrom[current] is not None:
+                    previous, left, right = cameFrom[current]
+                    corridor.append((left, right))
+                    current = previous
+                corridor.reverse()
+                return corridor
+            closedSet[current] = True
+            entryX, entryY = entryPoints[current]
+            for neighbor, left, right in self.portals[current]:
+                if closedSet[neighbor]:
+                    continue
+                middle = ((left[0] + right[0]) / 2.0, (left[1] + right[1]) / 2.0)
+                neighborGScore = gScore[current] + math.hypot(middle[0] - entryX, middle[1] - entryY)
+                if neighbor == endIndex:
+                    neighborGScore += math.hypot(end[0] - middle[0], end[1] - middle[1])
+                if neighborGScore < gScore[neighbor]:
+                    gScore[neighbor] = neighborGScore
+                    entryPoints[neighbor] = middle
+                    cameFrom[neighbor] = (current, left, right)
+                    heuristic = 0
+                    if neighbor != endIndex:
+                        heuristic = math.hypot(end[0] - middle[0], end[1] - middle[1])
+                    heapq.heappush(openSet, (neighborGScore + heuristic, neighbor))
+        return None
+
+
+if __name__ == "__main__":
+    for eggFileName in sys.argv[1:]:
+        polygons = buildNavMesh(readEggPolygons(eggFileName))
+        navFileName = eggFileName.rsplit(".", 1)[0] + ".nav"
+        writeNavMesh(navFileName, polygons, eggFileName)
+        print("Wrote " + str(len(polygons)) + " polygons to " + navFileName)
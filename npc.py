@@ -21,16 +21,28 @@ import math
 from math import sqrt
 from waypoint import Waypoint
 from pathFinder import PathFinder
+from pathStats import pathStats
+import radar
+from radar import radarActivations
+import steering
+from steering import SteeringCore
+from waypointGraph import NearestWaypointTracker
 from tasktimer import taskTimer
 from direct.showbase.DirectObject import DirectObject
 from pandac.PandaModules import CollisionHandlerEvent
         
-def RandGenerator():
+def RandomStreams(seed = None):
+    """
+    Yields a random.Random for each NPC, every one seeded from a generator seeded
+    with seed. The same seed gives every NPC the same draws on every run. With no
+    seed, the OS seeds the first generator, once.
+    """
+    seeds = random.Random(seed)
     while True:
-        random.seed()
-        yield random.uniform(-1000, 1000)
+        yield random.Random(seeds.getrandbits(64))
         
-RG = RandGenerator()
+# For NPCs that aren't given a stream of their own
+RS = RandomStreams()
 
 
 # needed for neat-python
@@ -56,7 +68,8 @@ class NPC(Agent, DirectObject):
                 massKg = 0.1,
                 collisionHandler = None,
                 collisionTraverser = None,
-                waypoints = None):
+                waypoints = None,
+                randomStream = None):
         Agent.__init__(self, modelStanding, modelAnimationDict, turnRate, speed, agentList, massKg, collisionMask, name, collisionHandler, collisionTraverser)
         self.collisionMask = collisionMask
         self.adjacencySensorThreshold = adjacencySensorThreshold
@@ -66,6 +79,10 @@ class NPC(Agent, DirectObject):
         self.brain = brain
         self.npcState = "playerAbsent"
         self.waypoints = waypoints
+        # Our own random numbers, so wandering can be replayed (see RandomStreams)
+        if randomStream is None:
+            randomStream = RS.next()
+        self.random = randomStream
 ##        if None == self.brain:
 ##            self.brain = chromosome.Chromosome.create_fully_connected()
 ##            if Config.hidden_nodes > 0:
@@ -78,6 +95,40 @@ class NPC(Agent, DirectObject):
         self.currentTarget = None
         self.player = None
         self.bestPath = None
+        self.pathIndex = 0
+        # Where we were when we started toward currentTarget
+        self.legStart = None
+        # How far we can stray from the line to currentTarget before smoothing it again
+        self.corridorTolerance = 4
+        self.waypointTracker = NearestWaypointTracker()
+        self.targetWaypointTrackers = {}
+        # Set this to replan with D* Lite, which keeps its search between calls
+        self.incrementalPlanning = False
+        self.incrementalPlanner = None
+        # Set this to spread path searches over several frames through PathFinder's scheduler
+        self.timeSlicedPlanning = False
+        # Or this to plan on PathFinder's worker thread instead
+        self.backgroundPlanning = False
+        # Or this to follow the room's shared flow field toward our target instead of searching
+        self.flowFieldPlanning = False
+        # Or this to plan through the room's navigation mesh, whose paths need no smoothing
+        self.navMeshPlanning = False
+        # Set this when something calls NPC.radarSweep for us each frame, so sense doesn't do it again
+        self.batchedRadar = False
+        # SpatialHash of agentList's positions in render, updated once a frame by whoever sets it
+        self.sensorGrid = None
+        self.agentIndices = {}
+        # Set by NPC.createSteering. While we have it, seek and wander only ask it to
+        # move us, and NPC.steerAll moves all of its NPCs together later in the frame.
+        self.steering = None
+        self.steeringIndex = None
+        # Where wander heads for, on a circle in front of us
+        self.wanderTarget = Vec2(0.0, 0.0)
+        self.callCount = 0
+        # How long our next act covers, up to maxElapsedTime. None is a frame; an AIScheduler sets it when it ticks us less often.
+        self.elapsedTime = None
+        # While a path request is pending we keep seeking our last target
+        self.pathRequest = None
         self.key = None
         self.keyInHand = False
         self.hasFallen = False
@@ -150,9 +201,12 @@ class NPC(Agent, DirectObject):
 
 
     def sense(self, task):
+        if pathStats.enabled:
+            pathStats.setAgent(self.name)
         #self.rangeFinderSense()
         #self.adjacencySense()
-        self.radarSense()
+        if not self.batchedRadar:
+            self.radarSense()
 
         return Task.cont
     
@@ -174,6 +228,10 @@ class NPC(Agent, DirectObject):
     def getState(self):
         return self.npcState
 
+    def isBusy(self):
+        """Whether we have to keep acting every frame even with the player away, as when taking the key home."""
+        return self.npcState == "returnKey"
+
 ##    def toggleShowWaypoints(self, value = None):
 ##        if(value):
 ##            self.showWaypoints = value
@@ -190,6 +248,8 @@ class NPC(Agent, DirectObject):
             
     isMoving = False
     def act(self, task):
+        if pathStats.enabled:
+            pathStats.setAgent(self.name)
         if(not self.hasFallen):
             if(self.getZ() < -100):
                 print(self.name + "Says: Aieee! I've fallen through the floor!! I'm at " + str(self.getPos()))
@@ -284,7 +344,7 @@ class NPC(Agent, DirectObject):
         if(self.npcState == "wander"):
             if(transition == "keyTaken"):
                 #print(self.name + " Says: Changing from wander to retriveKey")
-                self.bestPath = PathFinder.AStar(self, self.player, self.waypoints)
+                self.planPathTo(self.player)
                 self.player.setCurrentKey(self.key)
                 self.key.setScale(render, 10)
                 self.key.setTexScale(TextureStage.getDefault(), 1)
@@ -298,7 +358,7 @@ class NPC(Agent, DirectObject):
                 self.npcState = "retriveKey"
             elif(transition == "withinRange"):
                 #print(self.name + " Says: Changing from wander to Seek")
-                self.bestPath = [self.player]
+                self.setBestPath((self.player,))
                 self.npcState = "seek"
             elif(transition == "playerLeftRoom"):
                 #print(self.name + " Says: Changing from wander to playerAbsent")
@@ -321,7 +381,7 @@ class NPC(Agent, DirectObject):
                 self.key.setTexScale(TextureStage.getDefault(), 1)
 ##                self.key.flattenLight()
                 #print("Changing from gotKey to returnKey")
-                self.bestPath = PathFinder.AStar(self, self.keyNest, self.waypoints)
+                self.planPathTo(self.keyNest)
                 #print("AStar in transition from gotKey to return key = " + str(self.bestPath))
                 
                 #print("Does player STILL have the key?")
@@ -334,7 +394,7 @@ class NPC(Agent, DirectObject):
                 self.npcState = "playerAbsent"
             elif(transition == "bumpedIntoWall"):
                 #print(self.name + " Says: Oops! Bumped into wall, recalculating A*")
-                self.bestPath = PathFinder.AStar(self, self.player, self.waypoints)
+                self.planPathTo(self.player)
                 
             else:#Joe pleas don't comment out the else prints. I need to know any time this happens
                 print(transition + " is an undefined transition from " + self.npcState)
@@ -347,7 +407,7 @@ class NPC(Agent, DirectObject):
                 self.npcState = "playerAbsent"
             elif(transition  == "keyTaken"):
                 #print(self.name + " Says: Changing from seek to retriveKey")
-                self.bestPath = PathFinder.AStar(self, self.player, self.waypoints)
+                self.planPathTo(self.player)
                 #self.drawBestPath()
                 #print("AStar in seek from gotKey to returnKey = " + str(self.bestPath))                
                 self.player.setCurrentKey(self.key)
@@ -385,7 +445,7 @@ class NPC(Agent, DirectObject):
             if(transition == "playerEnteredRoom"):
                 if self.player.hasKey(self.key):    ##Got the error NPC object has no attribute key... How?????
                     #print(self.name + " Says: Changing from PlayerAbsent to retriveKey")
-                    self.bestPath = PathFinder.AStar(self, self.player, self.waypoints)
+                    self.planPathTo(self.player)
                     self.npcState = "retriveKey"
                 elif self.distanceToPlayer() < self.radarLength:
                     #print(self.name + " Says: Changing from playerAbsent to seek")
@@ -427,6 +487,16 @@ class NPC(Agent, DirectObject):
         
         #vectorToPlayer = playerPosition - ownPosition
         return self.getDistance(self.player)
+
+    def getNearbyAgents(self, radius):
+        """
+        The agents in agentList that could be within radius of us. With a sensorGrid
+        that's just those in the cells around us, otherwise it's all of them.
+        """
+        if self.sensorGrid is None:
+            return self.agentList
+        position = self.getPos(render)
+        return [entry[0] for entry in self.sensorGrid.getCandidates((position.getX(), position.getY(), position.getZ()), radius)]
     
     def rangeFinderSense(self):
         self.traverser.traverse(render)
@@ -450,30 +520,34 @@ class NPC(Agent, DirectObject):
 
     adjacencyTexts = {}
     def adjacencySense(self):
+        #Only the agents near us, and the ones that were adjacent last time, can change
+        agents = list(self.getNearbyAgents(self.adjacencySensorThreshold))
+        agents.extend([agent for agent in self.adjacentAgents if agent not in agents])
+        if len(self.agentIndices) != len(self.agentList):
+            self.agentIndices = dict([(self.agentList[i], i) for i in range(len(self.agentList))])
         # loop thru the positionDictionary
-        index = 0
-        for agent in self.agentList:
+        for agent in agents:
             if not self.adjacencyTexts.has_key(agent):
+                index = len(self.adjacencyTexts)
                 self.adjacencyTexts[agent] = OnscreenText(text="", style=1, fg=(1,1,1,1),
                         pos=(-1.3,-0.85 + (index*0.05)), align=TextNode.ALeft, scale = .05, mayChange = True)
-                index += 1
-        index = 0
-        for agent in self.agentList:
-            if self != agent:
-                transform = self.getPos() - agent.getPos()
+        for agent in agents:
+            index = self.agentIndices[agent]
+            #agentList holds the agents' Actors, our own included
+            if agent is not self.actor:
+                transform = self.getPos(render) - agent.getPos(render)
                 distance = transform.length()
                 self.adjacencyTexts[agent].clearText()
                 if distance <= self.adjacencySensorThreshold:
                     if agent not in self.adjacentAgents:
                         self.adjacentAgents.append(agent)
                     self.adjacencyTexts[agent].setText("Agent " + str(index) + ": (" + 
-                            str(agent.getPos().getX()) + ", " +
-                            str(agent.getPos().getY()) + ") at heading " + 
+                            str(agent.getX(render)) + ", " +
+                            str(agent.getY(render)) + ") at heading " + 
                             str(agent.getH()))
                 else:   
                     if agent in self.adjacentAgents:
                         self.adjacentAgents.remove(agent)
-            index += 1
         
 ##        self.adjacencyText.setText("Adjacent Agents: " + str(len(self.adjacentAgents)))
         return
@@ -488,10 +562,11 @@ class NPC(Agent, DirectObject):
 ##                             pos=(-1.3,0.70), align=TextNode.ALeft, scale = .05, mayChange = True)
     def radarSense(self):
         self.radarActivationLevels = [0] * self.radarSlices
-        for agent in self.agentList:
-            if self != agent:        
+        for agent in self.getNearbyAgents(self.radarLength):
+            #agentList holds the agents' Actors, our own included
+            if agent is not self.actor:
 
-                transform = agent.getPos() - self.getPos()
+                transform = agent.getPos(render) - self.getPos(render)
                 if transform.length() > self.radarLength:
                     continue
                 # Handle the special case
@@ -524,24 +599,84 @@ class NPC(Agent, DirectObject):
 ##        self.radarText.setText("Radar (Pie Slice): " + str(self.radarActivationLevels))
         return
 
-    @classmethod
+    @staticmethod
+    def radarSweep(npcs):
+        """
+        Does radarSense for all of npcs at once. With numpy, positions and headings are
+        gathered once and radarActivations works out every NPC's levels together;
+        without it each NPC senses on its own. NPCs sharing an agentList and a number
+        of slices are swept together, through their sensorGrid if they have one. Then
+        only the agents in the cells the radars reach are gathered, at the positions
+        the grid has for them. Like radarSense, each NPC leaves its own Actor out.
+        """
+        if radar.numpy is None:
+            for npc in npcs:
+                npc.radarSense()
+            return
+        groups = {}
+        for npc in npcs:
+            groups.setdefault((id(npc.agentList), npc.radarSlices), []).append(npc)
+        for group in groups.values():
+            npcPositions = []
+            for npc in group:
+                position = npc.getPos(render)
+                npcPositions.append((position.getX(), position.getY(), position.getZ()))
+            agentPositions = []
+            pairs = []
+            sensorGrid = group[0].sensorGrid
+            if sensorGrid is None:
+                agentList = group[0].agentList
+                for agent in agentList:
+                    position = agent.getPos(render)
+                    agentPositions.append((position.getX(), position.getY(), position.getZ()))
+                for i in range(len(group)):
+                    pairs.extend([(i, j) for j in range(len(agentList)) if agentList[j] is not group[i].actor])
+            else:
+                #Only the agents in the cells each radar reaches are measured
+                inAgentList = set(group[0].agentList)
+                agentIndices = {}
+                for i in range(len(group)):
+                    for agent, x, y, z in sensorGrid.getCandidates(npcPositions[i], group[i].radarLength):
+                        if agent not in inAgentList or agent is group[i].actor:
+                            continue
+                        if agent not in agentIndices:
+                            agentIndices[agent] = len(agentPositions)
+                            agentPositions.append((x, y, z))
+                        pairs.append((i, agentIndices[agent]))
+            levels = radarActivations(npcPositions, [npc.getH() for npc in group], agentPositions,
+                                      group[0].radarSlices, [npc.radarLength for npc in group], pairs)
+            for i in range(len(group)):
+                group[i].radarActivationLevels = levels[i].tolist()
+
+    # Longest time one act turns and moves us for. A throttled tick can cover half a second
+    # or more, and doing it in one go could swing us most of the way round or through a wall.
+    maxElapsedTime = 0.1
+    def getElapsedTime(self):
+        if self.elapsedTime is None:
+            return taskTimer.elapsedTime
+        return min(self.elapsedTime, self.maxElapsedTime)
+
     def RandomClamped(self):
-        r = float(RG.next())
+        r = self.random.uniform(-1000, 1000)
         r /= 1000
         return r
+
+    @staticmethod
+    def drawJitters(npcs, jitter):
+        """
+        Draws wander's (x, y) jitter for all of npcs at once, each from its own
+        stream. Each NPC gets the same values wander would have drawn for it.
+        """
+        return [(npc.RandomClamped() * jitter, npc.RandomClamped() * jitter) for npc in npcs]
             
-    wanderTarget = Vec2(0.0, 0.0)
-    callCount = 0
     def wander(self):
+        if self.steering is not None:
+            self.steering.wander(self.steeringIndex)
+            return
         self.callCount += 1
         wanderCircleRadius = 2.5
         if self.callCount == 5:
-            jitter = 50.
-            self.wanderTarget += Vec2(
-                self.RandomClamped() * jitter, 
-                self.RandomClamped() * jitter)
-            self.wanderTarget.normalize()
-            self.wanderTarget *= wanderCircleRadius
+            self.jitterWanderTarget(self.wanderTarget)
             self.callCount = 0
         
         # Now move the circle in front of us
@@ -551,8 +686,8 @@ class NPC(Agent, DirectObject):
         relativeX = (wanderCircleRadius * math.cos(theta))
         relativeY = (wanderCircleRadius * math.sin(theta)) - wanderDistance
         targetLocal = Vec2(relativeX, relativeY)        
-        distance = self.speed * taskTimer.elapsedTime
-        turnAngle = self.turnRate * taskTimer.elapsedTime
+        distance = self.speed * self.getElapsedTime()
+        turnAngle = self.turnRate * self.getElapsedTime()
         
         # Now we have a relative target. We should go there.
         heading = math.atan2(targetLocal.getY(), targetLocal.getX())
@@ -570,6 +705,47 @@ class NPC(Agent, DirectObject):
             self.isMoving = True
         return    
 
+    def jitterWanderTarget(self, wanderTarget):
+        """Nudges wanderTarget, a Vec2, in place by a random jitter and puts it back on the circle."""
+        wanderCircleRadius = 2.5
+        jitter = 50.
+        wanderTarget += Vec2(
+            self.RandomClamped() * jitter, 
+            self.RandomClamped() * jitter)
+        wanderTarget.normalize()
+        wanderTarget *= wanderCircleRadius
+
+    # Most jitters catchUpWander applies to the wander target. Each jitter is twenty times
+    # the wander circle, so the target hardly remembers any but the last few.
+    catchUpJitterLimit = 8
+    def catchUpWander(self, calls):
+        """
+        Brings our random numbers to where they would be had wander been called calls
+        more times, and our wander target close to where it would be, without moving
+        us. For NPCs that went unticked while wandering, such as an AIScheduler's
+        inactive ones. Every jitter is drawn, but only the last catchUpJitterLimit are
+        applied to the target, so it only approximates a target that saw them all.
+        It does nothing unless we're in a state that wanders.
+        """
+        if calls <= 0 or self.npcState not in ("wander", "playerAbsent"):
+            return
+        if self.steering is not None:
+            x, y, callCount = self.steering.getWanderState(self.steeringIndex)
+            wanderTarget = Vec2(x, y)
+        else:
+            wanderTarget, callCount = self.wanderTarget, self.callCount
+        jitters = (callCount + calls) // 5
+        #The jitters the target would forget anyway are drawn and thrown away, two numbers each
+        for i in range(2 * max(jitters - self.catchUpJitterLimit, 0)):
+            self.RandomClamped()
+        for i in range(min(jitters, self.catchUpJitterLimit)):
+            self.jitterWanderTarget(wanderTarget)
+        callCount = (callCount + calls) % 5
+        if self.steering is not None:
+            self.steering.setWanderState(self.steeringIndex, wanderTarget.getX(), wanderTarget.getY(), callCount)
+        else:
+            self.callCount = callCount
+
 
     
     generationLifetimeTicks = 500
@@ -629,12 +805,94 @@ class NPC(Agent, DirectObject):
         self.keyNest = keyNest
         self.key = key
     
+    def planPathTo(self, target, source = None):
+        """
+        Sets bestPath to a path from source (this NPC by default) to target. The trackers
+        remember the closest waypoints from the last call, so replanning while we chase
+        the player is cheap.
+        
+        With navMeshPlanning the path comes from the room's navigation mesh, and with
+        flowFieldPlanning we read the next couple of waypoints from the flow field
+        toward target that the whole room shares, instead of searching.
+
+        With timeSlicedPlanning or backgroundPlanning the path arrives on a later frame
+        instead. Until receivePath gets it the path is pending, and we keep following the
+        old path, or keep seeking our last target once that runs out.
+        """
+        if pathStats.enabled:
+            pathStats.setAgent(self.name)
+        sourceTracker = None
+        if source is None:
+            source = self
+            sourceTracker = self.waypointTracker
+        if self.navMeshPlanning:
+            self.setBestPath(PathFinder.navMeshPath(source, target, self.waypoints))
+            return
+        if self.flowFieldPlanning:
+            self.setBestPath(PathFinder.flowPath(source, target, self.waypoints, sourceTracker))
+            return
+        targetTracker = self.getTargetTracker(target)
+        if self.timeSlicedPlanning or self.backgroundPlanning:
+            if self.pathRequest is not None:
+                PathFinder.cancelPathRequest(self.pathRequest)
+            if self.currentTarget is None:
+                self.currentTarget = target
+            if self.backgroundPlanning:
+                self.pathRequest = PathFinder.requestPathInBackground(source, target, self.waypoints, self.receivePath,
+                                                                      smooth = self.pathSmoothening)
+            else:
+                self.pathRequest = PathFinder.requestPath(source, target, self.waypoints, self.receivePath,
+                                                          sourceTracker, targetTracker)
+        else:
+            self.setBestPath(PathFinder.AStar(source, target, self.waypoints, sourceTracker, targetTracker,
+                                              planner = self.getIncrementalPlanner()))
+
+    def isPathPending(self):
+        return self.pathRequest is not None
+
+    def receivePath(self, request, path):
+        # Anything newer than this request has already replaced it
+        if request is self.pathRequest:
+            self.pathRequest = None
+            # The worker already string pulled it if we asked
+            self.setBestPath(path, isSmooth = self.backgroundPlanning)
+
+    def getIncrementalPlanner(self):
+        if not self.incrementalPlanning:
+            return None
+        if self.incrementalPlanner is None:
+            self.incrementalPlanner = PathFinder.createIncrementalPlanner(self.waypoints)
+        return self.incrementalPlanner
+
+    def getTargetTracker(self, target):
+        if not self.targetWaypointTrackers.has_key(target):
+            self.targetWaypointTrackers[target] = NearestWaypointTracker()
+        return self.targetWaypointTrackers[target]
+    
+    def setBestPath(self, path, isSmooth = False):
+        """
+        Paths are tuples that may be shared with other NPCs through the path cache,
+        so we keep our place in them with pathIndex instead of popping waypoints off.
+
+        With pathSmoothening the path is string pulled here, once, unless isSmooth
+        says it already has been. followBestPath doesn't check it again unless we stray.
+        A path replaces any request still pending, but an empty one doesn't.
+        """
+        if path and self.pathRequest is not None:
+            PathFinder.cancelPathRequest(self.pathRequest)
+            self.pathRequest = None
+        if path and self.pathSmoothening and not self.navMeshPlanning and not isSmooth:
+            path = PathFinder.stringPullPath(self, path)
+        self.bestPath = path
+        self.pathIndex = 0
+        self.legStart = PathFinder.position(self)
+
     def followBestPath(self):
         """ 
         This function tells the NPC to continue following the best path 
         
         Basically, it checks the currentTarget to determine if we're already seeking to the correct waypoint.
-        When we finally reach the currentTarget, we pop it off the bestPath list and set the currentTarget
+        When we finally reach the currentTarget, we move pathIndex past it and set the currentTarget
         to the next waypoint in bestPath.
         
         At this point, we also need to re-run AStar from our new currentTarget to the destination, which is
@@ -643,34 +901,40 @@ class NPC(Agent, DirectObject):
 
         assert self.bestPath, "self.bestPath must be valid before calling followBestPath"
         
-        if self.currentTarget is not self.bestPath[0]:
-            self.currentTarget = self.bestPath[0]
+        if self.currentTarget is not self.bestPath[self.pathIndex]:
+            self.currentTarget = self.bestPath[self.pathIndex]
+            self.legStart = PathFinder.position(self)
         
-        #Comment out next two lines to disable path smoothening.
-        if(self.pathSmoothening):
-            #attempting to smoothen path
-            #print("Checking if there is a clear path to next target")
-            while(len(self.bestPath) > 1 and PathFinder.waypointIsReachable(self, self.bestPath[1])):
-                #print("Next waypoint is reachable, skippint to next")
-                self.bestPath.pop(0)
+        #The path was smoothed when we got it, so we only check our line of sight again if we've been
+        #pushed off the line to currentTarget. Navigation mesh paths are already smooth.
+        if(self.pathSmoothening and not self.navMeshPlanning):
+            if not PathFinder.isInCorridor(self, self.legStart, self.currentTarget, self.corridorTolerance):
+                self.bestPath = PathFinder.stringPullPath(self, self.bestPath[self.pathIndex:])
+                self.pathIndex = 0
                 self.currentTarget = self.bestPath[0]
-            #pass
-        #if(len(self.bestPath) > 1 and self.distanceToWall > PathFinder.distance(self, self.bestPath[1])):
-        #   self.bestPath.pop(0)
+                self.legStart = PathFinder.position(self)
         
         # have we reached our currentTarget?
         if PathFinder.distance(self, self.currentTarget) < 2: #This number must be greater than distance in seek()
-            assert self.currentTarget == self.bestPath.pop(0), "We've reached our currentTarget, but it's not in our bestPath"
+            assert self.currentTarget is self.bestPath[self.pathIndex], "We've reached our currentTarget, but it's not in our bestPath"
+            self.pathIndex += 1
             # Are there any waypoints left to follow?
-            if self.bestPath:
-                self.currentTarget = self.bestPath[0]
-            if len(self.bestPath) > 1:
-                self.bestPath = PathFinder.AStar(self.bestPath[0], self.bestPath[-1], self.waypoints)
+            if self.pathIndex == len(self.bestPath):
+                #Any request we're waiting on still stands, and we keep seeking currentTarget until it comes
+                self.bestPath = ()
+                self.pathIndex = 0
+            else:
+                self.currentTarget = self.bestPath[self.pathIndex]
+                if len(self.bestPath) - self.pathIndex > 1 and not self.isPathPending():
+                    self.planPathTo(self.bestPath[-1], source = self.currentTarget)
 
 
     def seek(self, position):
         #print("Seeking position " + str(position.getX()) + ", " + str(position.getY()))
         #print("Current position " + str(self.getX())     + ", " + str(position.getY()))
+        if self.steering is not None:
+            self.steering.seek(self.steeringIndex, position.getX(), position.getY())
+            return
         worldPosition = self.getPos(render)
         worldTargetPosition = position
         worldHeading = self.getH(render)
@@ -682,8 +946,8 @@ class NPC(Agent, DirectObject):
         #print("distanceToTarget = " + str(distanceToTarget))
         angleToTarget = worldDirectionToTarget - worldHeading + 180
         angleToTarget = angleToTarget % 360
-        turnAngle = self.turnRate * taskTimer.elapsedTime
-        distance = self.speed * taskTimer.elapsedTime
+        turnAngle = self.turnRate * self.getElapsedTime()
+        distance = self.speed * self.getElapsedTime()
         #To limit seek range, check against self.radarLength
         
 ##        self.targetTracker = CollisionRay()
@@ -736,6 +1000,64 @@ class NPC(Agent, DirectObject):
             #print("Target is out of range")
         return
 
+    @staticmethod
+    def createSteering(npcs):
+        """
+        Hands the seeking and wandering of npcs to one SteeringCore, which NPC.steerAll
+        then has to run every frame after they act. Each NPC's wander state moves into
+        the core's arrays. Returns the core, or None without numpy, in which case the
+        NPCs keep steering themselves.
+        """
+        if steering.numpy is None:
+            return None
+        wanderTargets = [(npc.wanderTarget.getX(), npc.wanderTarget.getY()) for npc in npcs]
+        core = SteeringCore([npc.speed for npc in npcs], [npc.turnRate for npc in npcs],
+                            [npc.getSx(render) for npc in npcs], wanderTargets,
+                            [npc.callCount for npc in npcs])
+        core.npcs = list(npcs)
+        for i in range(len(npcs)):
+            npcs[i].steering = core
+            npcs[i].steeringIndex = i
+        return core
+
+    @staticmethod
+    def steerAll(core):
+        """
+        Carries out this frame's seeks and wanders for every NPC in core. Positions and
+        headings are gathered once, core works out all the turns and moves together,
+        and each NPC that asked is then set where it ends up, fluidly so collisions
+        still catch it on the way. NPCs that asked for nothing aren't touched.
+        """
+        npcs = core.npcs
+        requested = core.getRequested()
+        positions = [(0.0, 0.0)] * len(npcs)
+        headings = [0.0] * len(npcs)
+        elapsedTimes = [0.0] * len(npcs)
+        for i in requested:
+            npc = npcs[i]
+            position = npc.getPos(render)
+            positions[i] = (position.getX(), position.getY())
+            headings[i] = npc.getH(render)
+            elapsedTimes[i] = npc.getElapsedTime()
+        jitters = NPC.drawJitters([npcs[i] for i in core.getJitterDue()], steering.wanderJitter)
+        positions, headings, moving = core.step(positions, headings, elapsedTimes, jitters)
+        #Lists are much quicker to read one item at a time
+        positions, headings, moving = positions.tolist(), headings.tolist(), moving.tolist()
+        for i in requested.tolist():
+            npc = npcs[i]
+            if 1 in moving[i]:
+                npc.setH(render, headings[i])
+                npc.setFluidPos(render, positions[i][0], positions[i][1], npc.getZ(render))
+            #The animations change as each request would have changed them, in order
+            for requestMoving in moving[i]:
+                if requestMoving == 1 and not npc.isMoving:
+                    npc.loop("run")
+                    npc.isMoving = True
+                elif requestMoving == 0 and npc.isMoving:
+                    npc.stop()
+                    npc.pose("walk", 5)
+                    npc.isMoving = False
+
 if __name__ == "__main__":
     N = NPC("models/ralph",
             {"run":"models/ralph-run"},
@@ -0,0 +1,152 @@
+"""
+Benchmarks the path finding code on synthetic graphs, without Panda3D.
+
+Three kinds of graph from syntheticGraphs are generated at each size:
+
+    geometric   random points, linked to every point within a fixed radius
+    grid        a square grid, linked to the four points around each point
+    maze        a square grid of cells with a corridor maze carved through it,
+                and a wall between every pair of cells it doesn't link
+
+For each graph we time the A* search that AStar, requestPath and the path
+service run (PathSearch on the CompactGraph), the closest waypoint lookup
+(WaypointGraph's grid), and line of sight checks against the maze's walls
+(WallMap, one at a time and batched). Graphs small enough for it also build
+WaypointGraph's all pairs table and time walking it, which is what AStar does
+for the rooms. Each line reports the mean time per query, nodes expanded per
+search and the peak memory a query allocates (Python 3 only).
+
+Nothing here opens a window or imports Panda3D, so it runs on any box with
+Python. Run it with:
+
+    python pathBenchmark.py
+    python pathBenchmark.py --sizes 10 1000 100000 --queries 50 --kinds grid maze
+"""
+import argparse
+import gc
+import random
+import sys
+from compactGraph import CompactGraph
+from pathScheduler import PathSearch
+from pathStats import clock
+from syntheticGraphs import NearestIndex, SyntheticWaypoint, distance, graphKinds, makeWaypoints, position
+from wallMap import WallMap
+from waypointGraph import WaypointGraph
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Biggest graph to build WaypointGraph's all pairs table for, since it's quadratic
+tableLimit = 1024
+
+def measure(function, traced = True):
+    """
+    Returns (result, seconds, peak bytes allocated) for function(). It is called once
+    to time it and, with tracemalloc, once more to trace its memory, since tracing
+    slows it down a lot. Peak is None without tracemalloc or if traced isn't set.
+    """
+    start = clock()
+    result = function()
+    seconds = clock() - start
+    peak = None
+    if tracemalloc is not None and traced:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def runSearch(graph, sourceID, targetID):
+    search = PathSearch(graph, sourceID, targetID)
+    search.step(graph.nodeCount + 1)
+    return search
+
+def summarize(name, kind, nodeCount, times, peaks, expanded = None):
+    line = "%-10s %7d  %-16s %10.4f ms" % (kind, nodeCount, name, 1000.0 * sum(times) / len(times))
+    if expanded is not None:
+        line += " %9.1f expanded" % (float(sum(expanded)) / len(expanded))
+    else:
+        line += " " * 18
+    if peaks and peaks[0] is not None:
+        line += " %9.1f KB peak" % (max(peaks) / 1024.0)
+    print(line.rstrip())
+
+def benchmark(kind, nodeCount, queries, rng):
+    positions, adjacency, walls = graphKinds[kind](nodeCount, rng)
+    nodeCount = len(positions)
+    graph, seconds, peak = measure(lambda: CompactGraph(positions, adjacency))
+    print("%-10s %7d  %-16s %10.4f ms %9d edges     %9.1f KB graph" %
+          (kind, nodeCount, "build", 1000.0 * seconds, graph.getEdgeCount(), graph.getMemoryUsage() / 1024.0))
+
+    pairs = [(rng.randrange(nodeCount), rng.randrange(nodeCount)) for i in range(queries)]
+    times, peaks, expanded = [], [], []
+    for sourceID, targetID in pairs:
+        search, seconds, peak = measure(lambda: runSearch(graph, sourceID, targetID))
+        times.append(seconds)
+        peaks.append(peak)
+        expanded.append(search.expanded)
+    summarize("search", kind, nodeCount, times, peaks, expanded)
+
+    waypoints = makeWaypoints(positions, adjacency)
+    index = NearestIndex(waypoints, distance, position)
+    maxX = max([x for x, y in positions])
+    maxY = max([y for x, y in positions])
+    points = [SyntheticWaypoint(rng.uniform(0, maxX), rng.uniform(0, maxY), -1) for i in range(queries)]
+    times, peaks = [], []
+    for point in points:
+        closest, seconds, peak = measure(lambda: index.getClosestReachable(point, lambda thing, waypoint: True))
+        times.append(seconds)
+        peaks.append(peak)
+    summarize("nearest", kind, nodeCount, times, peaks)
+
+    if walls:
+        wallMap = WallMap(walls)
+        starts = [position(point) for point in points]
+        ends = [position(waypoints[rng.randrange(nodeCount)]) for point in points]
+        times, peaks = [], []
+        for i in range(len(starts)):
+            clear, seconds, peak = measure(lambda: wallMap.isClear(starts[i], ends[i]))
+            times.append(seconds)
+            peaks.append(peak)
+        summarize("line of sight", kind, nodeCount, times, peaks)
+        clear, seconds, peak = measure(lambda: wallMap.areClear(starts, ends))
+        summarize("batched LOS", kind, nodeCount, [seconds / len(starts)], [peak])
+
+    if nodeCount <= tableLimit:
+        table, seconds, peak = measure(lambda: WaypointGraph(waypoints, distance, position), traced = False)
+        print("%-10s %7d  %-16s %10.4f ms" % (kind, nodeCount, "all pairs table", 1000.0 * seconds))
+        times, peaks = [], []
+        for sourceID, targetID in pairs:
+            path, seconds, peak = measure(lambda: table.pathBetween(waypoints[sourceID], waypoints[targetID]))
+            times.append(seconds)
+            peaks.append(peak)
+        summarize("table walk", kind, nodeCount, times, peaks)
+    sys.stdout.flush()
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = "Benchmarks path finding on synthetic graphs.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [10, 100, 1000, 10000, 100000])
+    parser.add_argument("--kinds", nargs = "+", choices = sorted(graphKinds.keys()), default = sorted(graphKinds.keys()))
+    parser.add_argument("--queries", type = int, default = 20, help = "queries of each kind per graph")
+    parser.add_argument("--seed", type = int, default = 1)
+    options = parser.parse_args(arguments)
+
+    rng = random.Random(options.seed)
+    for nodeCount in options.sizes:
+        for kind in options.kinds:
+            benchmark(kind, nodeCount, options.queries, rng)
+            gc.collect()
+    if resource is not None:
+        #ru_maxrss is in kilobytes on Linux
+        print("peak process memory: %.1f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,7 +1,20 @@
 from waypoint import Waypoint
+from waypointGraph import WaypointGraph, NearestWaypointTracker
+from flowField import FlowField
+from roomPlanner import RoomPlanner
+from navMesh import NavMesh, readNavMesh, distanceToSegment
+from waypointBuilder import loadRoomGraph
+from dStarLite import DStarLite
+from pathScheduler import PathScheduler, PathSearch, DONE
+from pathService import PathService, GraphSnapshot
+from pathStats import pathStats, clock
+from wallMap import WallMap, sliceConvexPolygon
+from direct.task import Task
 from pandac.PandaModules import BitMask32
 from pandac.PandaModules import CollisionNode
+from pandac.PandaModules import CollisionPolygon
 from pandac.PandaModules import CollisionRay
+from pandac.PandaModules import CollisionSegment
 from pandac.PandaModules import CollisionHandlerQueue
 from pandac.PandaModules import CollisionTraverser
 from pandac.PandaModules import GeomNode
@@ -10,14 +23,22 @@ from pandac.PandaModules import NodePath
 from pandac.PandaModules import Point3
 from pandac.PandaModules import Vec3
 
+import heapq
 import math
 from math import sqrt
 
+# Only the rooms' walls (see PathFinder.registerWalls) have this bit, so our rays skip everything else.
+# It has to be outside CollisionNode's default into mask (bits 0 to 19) and GeomNode's (bit 20),
+# or every agent sphere, floor and key would still block our rays.
+wallCollideMask = BitMask32.bit(21)
+
+# The rooms' wall nodes, in the order they were registered
+wallNPs = []
+
 wallRayNP = render.attachNewNode(CollisionNode("wall ray collision node"))
 wallRayNP.node().addSolid(CollisionRay(0,0,0,0,1,0))
 wallRayNP.node().setIntoCollideMask(BitMask32.allOff())
-wallRayNP.node().setFromCollideMask(BitMask32.allOn() & ~GeomNode.getDefaultCollideMask())
-wallRayNP.node().setFromCollideMask(wallRayNP.node().getFromCollideMask() & ~BitMask32.bit(1))
+wallRayNP.node().setFromCollideMask(wallCollideMask)
 #wallRayNP.show()
 
 collisionHandler = CollisionHandlerQueue()
@@ -25,7 +46,223 @@ collisionTraverser = CollisionTraverser("pathfinder's collisionTraverser")
 collisionTraverser.addCollider(wallRayNP, collisionHandler)
 collisionTraverser.setRespectPrevTransform(True)
 
+# Most segments to load for one traversal
+segmentsPerTraversal = 64
+
+# Batched line of sight: one CollisionSegment per query, each on its own from node tagged
+# with its slot, so a collision can be traced back to its query. They're all resolved in one traversal.
+segmentCollisionHandler = CollisionHandlerQueue()
+segmentCollisionTraverser = CollisionTraverser("pathfinder's batched collisionTraverser")
+wallSegmentNPs = []
+for slot in range(segmentsPerTraversal):
+    segmentNP = render.attachNewNode(CollisionNode("wall segment collision node"))
+    segmentNP.node().setIntoCollideMask(BitMask32.allOff())
+    segmentNP.node().setFromCollideMask(wallCollideMask)
+    segmentNP.setTag("segmentSlot", str(slot))
+    segmentCollisionTraverser.addCollider(segmentNP, segmentCollisionHandler)
+    wallSegmentNPs.append(segmentNP)
+
+# Precomputed graphs for each room's waypoint list, keyed by id() of the list
+waypointGraphs = {}
+
+# Flow fields toward shared targets, keyed by (id() of the room's waypoint list, target).
+# Each value is (field, target, waypoints, tracker for the target's closest waypoint).
+flowFields = {}
+
+# Navigation meshes for the rooms, keyed by id() of the room's waypoint list
+navMeshes = {}
+
+# Plans across rooms through the gates added with PathFinder.addGate. Rooms are
+# keyed by id() of their waypoint list, like waypointGraphs
+roomPlanner = RoomPlanner()
+
+# Time sliced searches from every NPC share this scheduler's per frame budget
+pathScheduler = PathScheduler(expansionsPerFrame = 200)
+
+# Plans paths on a worker thread against snapshots of the graphs and the level's walls
+pathService = PathService()
+
+# Flat 2D walls of the whole level, built by PathFinder.loadWalls
+wallMap = None
+
+# Whether line of sight is checked against wallMap instead of with rays. Only
+# PathFinder.enableWallMap sets it, once the map agrees with the rays.
+wallMapEnabled = False
+
+# Height above the floor that line of sight is checked at
+rayHeight = 3.5
+
+class NavPoint():
+    """
+    A corner of a path through a navigation mesh. NPCs seek it like a waypoint,
+    but it isn't in the scene graph.
+    """
+    graph = None
+
+    def __init__(self, x, y):
+        self.position = Point3(x, y, 0.5)
+
+    def getPos(self, other = None):
+        return Point3(self.position)
+
+    def getX(self, other = None):
+        return self.position.getX()
+
+    def getY(self, other = None):
+        return self.position.getY()
+
+
 class PathFinder():
+
+    @classmethod
+    def loadWaypointGraph(self, waypoints):
+        """
+        Precomputes the shortest paths between all of the waypoints in a room.
+        Call this once the room's neighbors are set up; AStar then walks the table.
+        """
+        graph = WaypointGraph(waypoints, self.distance, self.position)
+        waypointGraphs[id(waypoints)] = graph
+        return graph
+
+    @staticmethod
+    def loadRoomWaypoints(eggFileName, model):
+        """
+        Returns waypoints for a room, made from the graph waypointBuilder builds from
+        the room's egg file (or its cache of it). The graph is in model's coordinates,
+        so model must already be in place.
+        """
+        graph = loadRoomGraph(eggFileName)
+        mat = model.getMat(render)
+        waypoints = []
+        for nodeID in range(graph.nodeCount):
+            x, y = graph.getPosition(nodeID)
+            point = mat.xformPoint(Point3(x, y, 0))
+            waypoints.append(Waypoint(Vec3(point.getX(), point.getY(), 0.5), nodeID))
+        for waypoint in waypoints:
+            waypoint.setNeighbors([waypoints[neighborID] for neighborID in graph.getNeighborIDs(waypoint.ID)])
+        return waypoints
+
+    @staticmethod
+    def getWaypointGraph(waypoints):
+        return waypointGraphs.get(id(waypoints))
+
+    @staticmethod
+    def enableStats(enabled = True):
+        """Turns the path finder's counters and timers in pathStats on or off, starting them over."""
+        pathStats.enabled = enabled
+        pathStats.reset()
+
+    @staticmethod
+    def getStatsSnapshot():
+        """See PathStats.snapshot. Empty unless enableStats was called."""
+        return pathStats.snapshot()
+
+    @staticmethod
+    def formatStats():
+        """The last frame's numbers, a line per agent, for the debug overlay."""
+        return pathStats.format()
+
+    @staticmethod
+    def pathStatsTask(task):
+        #Add this after every other task that plans paths, so it closes the frame
+        pathStats.endFrame()
+        return Task.cont
+
+    @staticmethod
+    def getWallCollideMask():
+        return wallCollideMask
+
+    @staticmethod
+    def registerWalls(wallNP):
+        """
+        Marks a room's walls as the geometry our rays collide with. Every collision
+        node at or under wallNP gets wallCollideMask, on top of whatever bits the
+        agents collide with it by.
+        """
+        wallNP.setCollideMask(wallCollideMask, wallCollideMask, CollisionNode.getClassType())
+        wallNPs.append(wallNP)
+
+    @staticmethod
+    def loadWalls():
+        """
+        Cuts the collision polygons of the registered walls at rayHeight to get a flat
+        WallMap of the level. Line of sight is still checked with rays until
+        enableWallMap. Every room's graph is also handed to the path service as a
+        snapshot, since the graphs and walls are all in place.
+        """
+        segments = []
+        for wallNP in wallNPs:
+            collisionNPs = wallNP.findAllMatches("**/+CollisionNode")
+            collisionNPs = [wallNP] + [collisionNPs.getPath(i) for i in range(collisionNPs.getNumPaths())]
+            for collisionNP in collisionNPs:
+                node = collisionNP.node()
+                if not node.isOfType(CollisionNode.getClassType()):
+                    continue
+                mat = collisionNP.getMat(render)
+                for i in range(node.getNumSolids()):
+                    solid = node.getSolid(i)
+                    if not solid.isOfType(CollisionPolygon.getClassType()):
+                        continue
+                    points = [mat.xformPoint(solid.getPoint(j)) for j in range(solid.getNumPoints())]
+                    segment = sliceConvexPolygon([(p.getX(), p.getY(), p.getZ()) for p in points], rayHeight)
+                    if segment is not None:
+                        segments.append(segment)
+        global wallMap
+        wallMap = WallMap(segments)
+        for roomKey, graph in waypointGraphs.items():
+            pathService.setRoom(roomKey, GraphSnapshot(graph), wallMap)
+        return wallMap
+
+    @classmethod
+    def enableWallMap(self, roomsWaypoints):
+        """
+        Checks line of sight against the wall map from now on instead of with rays.
+        First the map is compared with the rays for every pair of waypoints in each
+        of roomsWaypoints, and it is only used if they agree on all of them.
+        """
+        disagreements = 0
+        for waypoints in roomsWaypoints:
+            disagreements += self.checkWallMap(waypoints)
+        assert disagreements == 0, "The wall map and the rays disagree on " + str(disagreements) + " pairs of waypoints"
+        global wallMapEnabled
+        wallMapEnabled = True
+
+    @staticmethod
+    def createIncrementalPlanner(waypoints):
+        """
+        Returns a D* Lite planner for a room's waypoints. Pass it to AStar as planner
+        and it keeps its search tree between calls instead of starting over.
+        """
+        return DStarLite(waypointGraphs[id(waypoints)])
+
+    @classmethod
+    def loadVisibility(self, waypoints):
+        """
+        Precomputes line of sight between all of the waypoints in a room. The room
+        has to be loaded and tagged first. Every pair is checked in one batch, against
+        the wall map after enableWallMap and with collision segments otherwise.
+        """
+        graph = waypointGraphs[id(waypoints)]
+        pairs = [(waypoint, other) for waypoint in waypoints for other in waypoints]
+        clear = self.linesAreClear(pairs)
+        answers = dict([((pairs[i][0].ID, pairs[i][1].ID), clear[i]) for i in range(len(pairs))])
+        graph.buildVisibility(lambda waypoint, other: answers[(waypoint.ID, other.ID)])
+
+    @classmethod
+    def checkWallMap(self, waypoints):
+        """
+        Compares the wall map against collision rays for every pair of waypoints in a
+        room, prints the pairs they disagree on and returns how many. Needs loadWalls.
+        """
+        disagreements = 0
+        for waypoint in waypoints:
+            for other in waypoints:
+                if other is waypoint:
+                    continue
+                if wallMap.isClear(self.position(waypoint), self.position(other)) != self.rayIsClear(waypoint, other):
+                    print("Wall map and rays disagree between waypoints " + str(waypoint.ID) + " and " + str(other.ID))
+                    disagreements += 1
+        return disagreements
     
 ##    def __init__(self, position, ID = -1):
 ##        NodePath.__init__(self, "Waypoint")
@@ -38,8 +275,54 @@ class PathFinder():
 ##        self.previousWaypoint = None
 
     @classmethod
-    def AStar(self, source, target, waypoints):
+    def getClosestWaypoint(self, thing, waypoints, tracker = None):
+        """
+        Returns the closest waypoint that thing has a clear line to, or None.
+        """
+        if pathStats.enabled:
+            pathStats.add("closestLookups")
+        infinity = 1E400
+        #Make sure there is a direct path between thing and the nearestWaypoint.
+        possiblyReachableWaypoints = waypoints
+
+        #Use the room's spatial index when it has one
+        graph = waypointGraphs.get(id(waypoints))
+        if graph is not None:
+            if getattr(thing, "graph", None) is graph:
+                return thing
+            if tracker is not None:
+                return tracker.getClosestReachable(graph, thing, self.waypointIsReachable, self.waypointsAreReachable)
+            return graph.getClosestReachable(thing, self.waypointIsReachable, self.waypointsAreReachable)
+
+        #Find closest Waypoint
+        shortestDistanceFound = infinity
+        closestNodeToSource = None
+        closestNodeIndex = 0
+        if thing in waypoints:
+            closestNodeToSource = thing
+        else:
+            #print("====================================")
+            for i in range(len(waypoints)):
+                #print("distance = " + str(self.distance(self, self.waypoints[i])))
+                if self.distance(thing, possiblyReachableWaypoints[i]) < shortestDistanceFound \
+                                            and self.waypointIsReachable(thing, possiblyReachableWaypoints[i]):
+                    closestNodeToSource = possiblyReachableWaypoints[i]
+                    shortestDistanceFound = self.distance(thing, possiblyReachableWaypoints[i])
+            #print("=====================================")
+        return closestNodeToSource
+
+    @classmethod
+    def AStar(self, source, target, waypoints, sourceTracker = None, targetTracker = None, planner = None):
+        """
+        Finds a path of waypoints from source to target, ending with target itself.
+        The path is a tuple and may be shared with other agents, so don't modify it.
+        The trackers are optional NearestWaypointTrackers that remember the closest
+        waypoint to source and target between calls. If planner is given (see
+        createIncrementalPlanner), it finds the path between the closest waypoints.
+        """
 ##        print "AStar called"
+        if pathStats.enabled:
+            pathStats.add("aStarCalls")
         infinity = 1E400
         
 ##  def castRayToNextTarget(self):
@@ -61,124 +344,416 @@ class PathFinder():
 # self.distanceToWall = entry.getSurfacePoint(self).length()
 
         
-        def getClosestNodeTo(thing):
-            #Make sure there is a direct path between thing and the nearestWaypoint.
-            possiblyReachableWaypoints = waypoints
-            
-            #Find closest Waypoint
-            shortestDistanceFound = infinity
-            closestNodeToSource = None
-            closestNodeIndex = 0
-            if thing in waypoints:
-                closestNodeToSource = thing
-            else:
-                #print("====================================")
-                for i in range(len(waypoints)):
-                    #print("distance = " + str(self.distance(self, self.waypoints[i])))
-                    if self.distance(thing, possiblyReachableWaypoints[i]) < shortestDistanceFound \
-                                                and self.waypointIsReachable(thing, possiblyReachableWaypoints[i]):
-                        closestNodeToSource = possiblyReachableWaypoints[i]
-                        shortestDistanceFound = self.distance(thing, possiblyReachableWaypoints[i])
-                #print("=====================================")
-            return closestNodeToSource
-        
 ##        print("Got here")
-        closestNodeToSource = getClosestNodeTo(source)
+        closestNodeToSource = self.getClosestWaypoint(source, waypoints, sourceTracker)
         
 ##        print("Closest Node = " + str(closestNodeToSource.getNodeID()) + " at pos (" + str(closestNodeToSource.getX()) + ", " + str(closestNodeToSource.getY())) + ")"
         closestNodeToSource.changeToYellow()
         #print("Starting node = " + str(closestNodeToSelf.getNodeID()) + " exected to be B4 which is 14") 
-        closestNodeToTarget = getClosestNodeTo(target)
+        closestNodeToTarget = self.getClosestWaypoint(target, waypoints, targetTracker)
         #print("End node = " + str(closestNodeToTarget.getNodeID()) + "expected to be A6 which is 6")
         closestNodeToTarget.changeToGreen()
+
+        if planner is not None:
+            pathToTarget = planner.plan(closestNodeToSource, closestNodeToTarget)
+            if pathToTarget is None:
+                return None
+            return tuple(pathToTarget) + (target,)
+
+        #The rooms' graphs don't change at runtime, so use the precomputed table when there is one
+        graph = waypointGraphs.get(id(waypoints))
+        if graph is not None:
+            pathToTarget = graph.getCachedPath(closestNodeToSource, closestNodeToTarget)
+            if pathToTarget is None:
+                return None
+            return pathToTarget + (target,)
         
         
-        #AStar from wiki
-        def reconstructPath(cameFrom, currentNode):            
-            #print("Reconstructing path")
+        #AStar from wiki, with a binary heap for the open set.
+        #Scores live in flat lists indexed by Waypoint.ID instead of dicts keyed by NodePath.
+        def reconstructPath(cameFrom, currentNode):
             pathToTarget = [currentNode]
-            while cameFrom.has_key(currentNode):
-##                print("ID of currentNode = " + str(currentNode.getNodeID()))
-                pathToTarget.append(cameFrom[currentNode])
-                currentNode = cameFrom[currentNode]
+            while cameFrom[currentNode.ID] is not None:
+                currentNode = cameFrom[currentNode.ID]
+                pathToTarget.append(currentNode)
             pathToTarget.reverse()
             return pathToTarget
-            
-##            print("Reconstructing path")
-##            pathToTarget = []
-##            if cameFrom.has_key(currentNode):
-##                print("Current Node ID = " + str(currentNode.getNodeID()))
-##                returnValue = reconstructPath(cameFrom,cameFrom[currentNode])
-##                if returnValue != None:
-##                    pathToTarget = returnValue
-##                    print("Returning something != None")
-##                return pathToTarget.append(currentNode)
-##            else:
-##                ##print("reconstuct path returning none")
-##                return None
-
-        closedSet = []
-        openSet = [closestNodeToSource]
-        gScore = {closestNodeToSource: 0} # Distance from start along optimal path.
-        hScore = {closestNodeToSource: self.distance(closestNodeToSource, closestNodeToTarget)}
-        fScore = {closestNodeToSource: hScore[closestNodeToSource]} #Estimated total distance from start to goal
-        
-        infinity = 1E400
-        cameFrom = {}
-        while len(openSet) > 0:
-            #print("size of openSet = " + str(len(openSet)))
-            lowestFScoreFound = infinity 
-            nodeWithLowestFScoreFound = None #Node in openset having lowest fScore[] value
-            for waypoint in openSet:
-                if fScore[waypoint] < lowestFScoreFound:
-                    lowestFScoreFound = fScore[waypoint]
-                    nodeWithLowestFScoreFound = waypoint
-            #Make sure that something was found
-            if(nodeWithLowestFScoreFound == None):
-                print("Something went horribly wrong, no node found with fScore < infinity")
-                
-            if nodeWithLowestFScoreFound == closestNodeToTarget: #If goal is found
-                returnValue = reconstructPath(cameFrom, closestNodeToTarget) #Be sure to define cameFrom
-##                if returnValue == None:
-##                    print("A* returning None")
-##                else:
-##                    print("A* is NOT returning None")
-                return returnValue + [target]
-            
-            openSet.remove(nodeWithLowestFScoreFound)
-            closedSet.append(nodeWithLowestFScoreFound)
-            #print("Current node has " + str(len(nodeWithLowestFScoreFound.getNeighbors())) + " neighbors")
-            for neighbor in nodeWithLowestFScoreFound.getNeighbors():
-                #print("Checking neighbor " + str(neighbor.getNodeID()))
-                if neighbor in closedSet:
+
+        nodeCount = max([waypoint.ID for waypoint in waypoints]) + 1
+        closedSet = [False] * nodeCount
+        openOrder = [None] * nodeCount #Order in which each node first entered the open set, used to break ties
+        gScore = [infinity] * nodeCount # Distance from start along optimal path.
+        hScore = [0.0] * nodeCount
+        fScore = [infinity] * nodeCount #Estimated total distance from start to goal
+        cameFrom = [None] * nodeCount
+
+        sourceID = closestNodeToSource.ID
+        gScore[sourceID] = 0
+        hScore[sourceID] = self.distance(closestNodeToSource, closestNodeToTarget)
+        fScore[sourceID] = hScore[sourceID]
+        openOrder[sourceID] = 0
+        openCount = 1
+        #Entries are (fScore, openOrder, waypoint). Stale entries are skipped when popped (lazy deletion).
+        openSet = [(fScore[sourceID], 0, closestNodeToSource)]
+        expanded = 0
+        openSetPeak = 1
+        while openSet:
+            currentFScore, currentOrder, current = heapq.heappop(openSet)
+            currentID = current.ID
+            if closedSet[currentID] or currentFScore != fScore[currentID]:
+                continue
+
+            expanded += 1
+            openSetPeak = max(openSetPeak, len(openSet) + 1)
+            if current is closestNodeToTarget: #If goal is found
+                self.recordSearch(expanded, openSetPeak)
+                return tuple(reconstructPath(cameFrom, closestNodeToTarget)) + (target,)
+
+            closedSet[currentID] = True
+            for neighbor in current.getNeighbors():
+                neighborID = neighbor.ID
+                if closedSet[neighborID]:
                     continue
-                neighborGScore = gScore[nodeWithLowestFScoreFound] + self.distance(nodeWithLowestFScoreFound, neighbor)
-##                print("neighborGScore = " + str(neighborGScore))
-                #print("gScore[neighbor] = " + str(gScore[neighbor]))
+                neighborGScore = gScore[currentID] + self.distance(current, neighbor)
                 #Assume that neighbor is not better than what we have
                 neighborIsBetter = False
-                if neighbor not in openSet:
-                    openSet.append(neighbor)
-                    hScore[neighbor] = self.distance(neighbor, closestNodeToTarget)
+                if openOrder[neighborID] is None:
+                    openOrder[neighborID] = openCount
+                    openCount += 1
+                    hScore[neighborID] = self.distance(neighbor, closestNodeToTarget)
                     neighborIsBetter = True
-                elif neighborGScore < gScore[neighbor]:
+                elif neighborGScore < gScore[neighborID]:
                     neighborIsBetter = True
                 if neighborIsBetter:
-                    cameFrom[neighbor] = nodeWithLowestFScoreFound
-                    ##print("cameFrom is type " + str(type(cameFrom)))
-                    gScore[neighbor] = neighborGScore
-                    fScore[neighbor] = gScore[neighbor] + hScore[neighbor]
-##        print("Returning NONE from A*")
+                    cameFrom[neighborID] = current
+                    gScore[neighborID] = neighborGScore
+                    fScore[neighborID] = neighborGScore + hScore[neighborID]
+                    heapq.heappush(openSet, (fScore[neighborID], openOrder[neighborID], neighbor))
+        self.recordSearch(expanded, openSetPeak)
         return None
+
+    @staticmethod
+    def recordSearch(expanded, openSetPeak):
+        if pathStats.enabled:
+            pathStats.add("nodesExpanded", expanded)
+            pathStats.add("openSetPeak", openSetPeak)
     
+    @staticmethod
+    def position(thing):
+        return thing.getX(render), thing.getY(render)
+
     @staticmethod
     def distance(source, target):
        return (source.getPos(render) - target.getPos(render)).length()
 #        return math.hypot(source.getX(render) - target.getX(render), source.getY(render) - target.getY(render))
         #return source.getDistance(target)
         
+    @staticmethod
+    def loadNavMesh(waypoints, model, fileName):
+        """
+        Loads a navigation mesh written by navMesh.py for the room that waypoints
+        belong to. The mesh is in model's coordinates, so model must already be in place.
+        """
+        mat = model.getMat(render)
+        polygons = []
+        for polygon in readNavMesh(fileName):
+            points = [mat.xformPoint(Point3(x, y, 0)) for x, y in polygon]
+            polygons.append([(point.getX(), point.getY()) for point in points])
+        navMeshes[id(waypoints)] = NavMesh(polygons)
+        return navMeshes[id(waypoints)]
+
+    @classmethod
+    def navMeshPath(self, source, target, waypoints):
+        """
+        Like AStar, but through the room's navigation mesh. The path is already pulled
+        tight around the corners, so it doesn't need smoothing.
+        """
+        corners = navMeshes[id(waypoints)].findPath(self.position(source), self.position(target))
+        if corners is None:
+            return None
+        return tuple([NavPoint(x, y) for x, y in corners[:-1]]) + (target,)
+
+    @classmethod
+    def getFlowField(self, waypoints, target):
+        """
+        Returns the room's flow field toward target, making it the first time anyone
+        asks. flowFieldTask keeps it pointed at target's closest waypoint.
+        """
+        key = (id(waypoints), target)
+        if key not in flowFields:
+            field = FlowField(waypointGraphs[id(waypoints)])
+            flowFields[key] = (field, target, waypoints, NearestWaypointTracker())
+            self.updateFlowField(key)
+        return flowFields[key][0]
+
+    @classmethod
+    def updateFlowField(self, key):
+        field, target, waypoints, tracker = flowFields[key]
+        goal = self.getClosestWaypoint(target, waypoints, tracker)
+        if goal is None:
+            field.setGoal(None)
+            return
+        #This runs every frame, so only load the goal's texture when the goal moves
+        if goal.ID != field.goalID:
+            goal.changeToGreen()
+        #Still called for the same goal, in case the graph changed under it. It's cheap when nothing did.
+        field.setGoal(goal.ID)
+
+    @classmethod
+    def flowPath(self, source, target, waypoints, sourceTracker = None):
+        """
+        Like AStar, but reads the way from the room's flow field toward target. The
+        path only goes two waypoints ahead, (closest, next, target), since asking again
+        from next when we get there is just another lookup. Returns None if target
+        can't be reached.
+        """
+        field = self.getFlowField(waypoints, target)
+        closestNodeToSource = self.getClosestWaypoint(source, waypoints, sourceTracker)
+        if closestNodeToSource is None or field.goalID is None:
+            return None
+        nextNode = field.getNextWaypoint(closestNodeToSource)
+        if nextNode is None:
+            return None
+        if nextNode is closestNodeToSource:
+            return (closestNodeToSource, target)
+        return (closestNodeToSource, nextNode, target)
+
+    @classmethod
+    def flowFieldTask(self, task):
+        #Once a frame per field, however many NPCs follow it
+        if pathStats.enabled:
+            pathStats.setAgent(None)
+        for key in flowFields.keys():
+            self.updateFlowField(key)
+        return Task.cont
+
+    @classmethod
+    def addGate(self, gate, waypoints, otherWaypoints):
+        """
+        Lets crossRoomPath go between two rooms through gate. Each side of the gate
+        is the closest waypoint in its room that can see it.
+        """
+        nodes = []
+        for roomWaypoints in (waypoints, otherWaypoints):
+            roomPlanner.addRoom(id(roomWaypoints), waypointGraphs[id(roomWaypoints)])
+            nodes.append(self.getClosestWaypoint(gate, roomWaypoints))
+        if None in nodes:
+            print("Can't reach " + gate.getName() + " from both of its rooms")
+            return
+        cost = self.distance(nodes[0], gate) + self.distance(gate, nodes[1])
+        roomPlanner.addPortal(id(waypoints), nodes[0].ID, id(otherWaypoints), nodes[1].ID, cost, gate)
+
+    @classmethod
+    def crossRoomPath(self, source, sourceWaypoints, target, targetWaypoints):
+        """
+        Like AStar, but source and target can be in different rooms. The path goes
+        through the waypoints of each room and the gates between them, ending at
+        target. Returns None if there is no way there.
+        """
+        closestNodeToSource = self.getClosestWaypoint(source, sourceWaypoints)
+        closestNodeToTarget = self.getClosestWaypoint(target, targetWaypoints)
+        if closestNodeToSource is None or closestNodeToTarget is None:
+            return None
+        steps = roomPlanner.findPath(id(sourceWaypoints), closestNodeToSource.ID,
+                                     id(targetWaypoints), closestNodeToTarget.ID)
+        if steps is None:
+            return None
+        path = []
+        for i in range(len(steps)):
+            roomKey, nodeID = steps[i]
+            if i > 0 and steps[i - 1][0] != roomKey:
+                path.append(roomPlanner.getPortalData(steps[i - 1], steps[i]))
+            path.append(waypointGraphs[roomKey].waypointsByID[nodeID])
+        path.append(target)
+        return tuple(path)
+
+    @classmethod
+    def requestPath(self, source, target, waypoints, callback, sourceTracker = None, targetTracker = None):
+        """
+        Time sliced version of AStar. The closest waypoints are found right away, but
+        the search runs a slice at a time from pathSchedulerTask. callback(request, path)
+        is called on a later frame with the same path AStar would return. Returns the
+        request, which can be passed to cancelPathRequest.
+        """
+        graph = waypointGraphs[id(waypoints)]
+        closestNodeToSource = self.getClosestWaypoint(source, waypoints, sourceTracker)
+        closestNodeToTarget = self.getClosestWaypoint(target, waypoints, targetTracker)
+
+        #The search finishes on a later frame, but it's still this agent's
+        agent = pathStats.agent
+
+        def finished(search):
+            if pathStats.enabled:
+                previousAgent = pathStats.agent
+                pathStats.setAgent(agent)
+                self.recordSearch(search.expanded, search.openSetPeak)
+                pathStats.setAgent(previousAgent)
+            pathToTarget = None
+            if search.status == DONE:
+                pathToTarget = tuple([graph.waypointsByID[nodeID] for nodeID in search.pathIDs]) + (target,)
+            callback(search, pathToTarget)
+
+        sourceID = targetID = None
+        if closestNodeToSource is not None and closestNodeToTarget is not None:
+            sourceID = closestNodeToSource.ID
+            targetID = closestNodeToTarget.ID
+        if not graph.isValid:
+            graph.build()
+        return pathScheduler.submit(PathSearch(graph.compact, sourceID, targetID), finished)
+
+    @classmethod
+    def requestPathInBackground(self, source, target, waypoints, callback, smooth = False):
+        """
+        Like requestPath, but the closest waypoints, the search and (if smooth is set)
+        string pulling all happen on the path service's worker thread. Needs loadWalls.
+        callback(request, path) is called from pathServiceTask on a later frame.
+        """
+        graph = waypointGraphs[id(waypoints)]
+
+        def finished(request, pathIDs):
+            pathToTarget = None
+            if pathIDs is not None:
+                pathToTarget = tuple([graph.waypointsByID[nodeID] for nodeID in pathIDs]) + (target,)
+            callback(request, pathToTarget)
+
+        return pathService.request(id(waypoints), self.position(source), self.position(target), finished, smooth)
+
+    @staticmethod
+    def cancelPathRequest(request):
+        if isinstance(request, PathSearch):
+            pathScheduler.cancel(request)
+        else:
+            pathService.cancel(request)
+
+    @staticmethod
+    def pathServiceTask(task):
+        pathService.update()
+        return Task.cont
+
+    @staticmethod
+    def pathSchedulerTask(task):
+        if pathStats.enabled:
+            pathStats.setAgent(None)
+        pathScheduler.update()
+        return Task.cont
+
+    @classmethod
+    def stringPullPath(self, thing, path):
+        """
+        Shortens path by skipping ahead, from thing and then from each point we keep,
+        to the furthest point along the path that is in plain sight. Each point we keep
+        costs one batched line of sight check (none between waypoints that have
+        precomputed visibility). If thing can't see any of the path, it keeps path[0].
+        """
+        pulled = []
+        current = thing
+        i = -1
+        while i < len(path) - 1:
+            reachable = self.waypointsAreReachable(current, path[i + 1:])
+            furthest = 0
+            if True in reachable:
+                furthest = len(reachable) - 1 - reachable[::-1].index(True)
+            i += furthest + 1
+            pulled.append(path[i])
+            current = path[i]
+        return tuple(pulled)
+
+    @classmethod
+    def isInCorridor(self, thing, start, end, tolerance):
+        """Whether thing is within tolerance of the line from start, an (x, y), to end."""
+        x, y = self.position(thing)
+        endX, endY = self.position(end)
+        return distanceToSegment(x, y, start[0], start[1], endX, endY) <= tolerance
+
     @staticmethod
     def waypointIsReachable(thing, waypoint):
+        #Waypoints don't move, so use the precomputed line of sight between them when we have it
+        graph = getattr(waypoint, "graph", None)
+        if graph is not None and graph.hasVisibility and getattr(thing, "graph", None) is graph:
+            return graph.isVisible(thing, waypoint)
+        return PathFinder.lineIsClear(thing, waypoint)
+
+    @staticmethod
+    def waypointsAreReachable(thing, waypoints):
+        """Batched waypointIsReachable. Returns one answer per waypoint."""
+        reachable = [None] * len(waypoints)
+        pending = []
+        for i in range(len(waypoints)):
+            graph = getattr(waypoints[i], "graph", None)
+            if graph is not None and graph.hasVisibility and getattr(thing, "graph", None) is graph:
+                reachable[i] = graph.isVisible(thing, waypoints[i])
+            else:
+                pending.append(i)
+        if pending:
+            clear = PathFinder.linesAreClear([(thing, waypoints[i]) for i in pending])
+            for j in range(len(pending)):
+                reachable[pending[j]] = clear[j]
+        return reachable
+
+    @staticmethod
+    def linesAreClear(pairs):
+        """Batched lineIsClear for a list of (thing, waypoint) pairs."""
+        if wallMapEnabled:
+            if pathStats.enabled:
+                pathStats.add("wallMapChecks", len(pairs))
+            return wallMap.areClear([PathFinder.position(thing) for thing, waypoint in pairs],
+                                    [PathFinder.position(waypoint) for thing, waypoint in pairs])
+        clear = []
+        for first in range(0, len(pairs), segmentsPerTraversal):
+            clear.extend(PathFinder.raysAreClear(pairs[first:first + segmentsPerTraversal]))
+        return clear
+
+    @staticmethod
+    def raysAreClear(pairs):
+        """
+        Checks the line between each (thing, waypoint) pair for walls with a single
+        collision traversal. Each pair's CollisionSegment goes on its own from node,
+        and each collision is mapped back to its pairs by the slot tagged on the
+        node it came from. Takes at most segmentsPerTraversal pairs.
+        """
+        slots = {}
+        pairIndices = []
+        for i in range(len(pairs)):
+            thing, waypoint = pairs[i]
+            ends = (thing.getX(render), thing.getY(render), waypoint.getX(render), waypoint.getY(render))
+            #Pairs with the same ends share a segment
+            if ends not in slots:
+                slots[ends] = len(pairIndices)
+                segmentNode = wallSegmentNPs[len(pairIndices)].node()
+                segmentNode.addSolid(CollisionSegment(Point3(ends[0], ends[1], rayHeight), Point3(ends[2], ends[3], rayHeight)))
+                pairIndices.append([])
+            pairIndices[slots[ends]].append(i)
+
+        if pathStats.enabled:
+            pathStats.add("rayCasts", len(pairIndices))
+            start = clock()
+            segmentCollisionTraverser.traverse(render)
+            pathStats.add("traversalTime", clock() - start)
+        else:
+            segmentCollisionTraverser.traverse(render)
+
+        clear = [True] * len(pairs)
+        # The segments only collide with walls, so any entry means that pair is blocked
+        for i in xrange(segmentCollisionHandler.getNumEntries()):
+            entry = segmentCollisionHandler.getEntry(i)
+            for j in pairIndices[int(entry.getFromNodePath().getTag("segmentSlot"))]:
+                clear[j] = False
+        #Empty nodes don't collide, so the slots we didn't use sit out the next traversal
+        for slot in range(len(pairIndices)):
+            wallSegmentNPs[slot].node().clearSolids()
+        return clear
+
+    @staticmethod
+    def lineIsClear(thing, waypoint):
+        #The wall map answers the same question as a ray without a collision traversal
+        if wallMapEnabled:
+            if pathStats.enabled:
+                pathStats.add("wallMapChecks")
+            return wallMap.isClear(PathFinder.position(thing), PathFinder.position(waypoint))
+        return PathFinder.rayIsClear(thing, waypoint)
+
+    @staticmethod
+    def rayIsClear(thing, waypoint):
         distanceToTarget = PathFinder.distance(thing, waypoint)
         
         #Calculate direction from thing to waypoint
@@ -186,24 +761,27 @@ class PathFinder():
         worldXDirection = waypoint.getX(render) - thing.getX(render)
         
         # We need to keep the ray not reparented to thing, because it uses a separate collision traverser.
-        origin = Point3(thing.getX(render), thing.getY(render), 3.5)
+        origin = Point3(thing.getX(render), thing.getY(render), rayHeight)
         wallRayNP.setPos(render, origin)
-        lookPt = Point3(waypoint.getX(render), waypoint.getY(render), 3.5)
+        lookPt = Point3(waypoint.getX(render), waypoint.getY(render), rayHeight)
         wallRayNP.lookAt(lookPt)
         
-        collisionTraverser.traverse(render)
+        if pathStats.enabled:
+            pathStats.add("rayCasts")
+            start = clock()
+            collisionTraverser.traverse(render)
+            pathStats.add("traversalTime", clock() - start)
+        else:
+            collisionTraverser.traverse(render)
         collisionHandler.sortEntries()
 
         #TODO This should never be this after the following code is executed
         distanceToWall = distanceToTarget
 
-        # We check the tags to make sure that we're colliding into a room
-        for i in xrange(collisionHandler.getNumEntries()):
-           entry = collisionHandler.getEntry(i)
-           intoNP = entry.getIntoNodePath()
-           if intoNP.getTag("Room"):
-              distanceToWall = (entry.getFromNodePath().getPos(render) - entry.getSurfacePoint(render)).length()
-              break
+        # The ray only collides with walls, so the first entry is the nearest wall
+        if collisionHandler.getNumEntries() > 0:
+           entry = collisionHandler.getEntry(0)
+           distanceToWall = (entry.getFromNodePath().getPos(render) - entry.getSurfacePoint(render)).length()
 
         #Compare "distance to thing" to "distance to wall" to decide if there is a wall in the way.
         if(distanceToTarget <= distanceToWall):
@@ -0,0 +1,121 @@
+import heapq
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+class PathSearch():
+    """
+    An A* search between two node IDs of a CompactGraph that can be paused and
+    resumed. Each call to step() expands at most the given number of nodes and
+    returns the search's status. Once it is DONE, pathIDs holds the IDs from
+    source to target.
+    """
+
+    def __init__(self, graph, sourceID, targetID):
+        self.graph = graph
+        self.status = PENDING
+        self.pathIDs = None
+        self.expanded = 0
+        self.openSetPeak = 0
+        #No waypoint could be reached from one of the ends
+        if sourceID is None or targetID is None:
+            self.status = FAILED
+            return
+        self.sourceID = sourceID
+        self.targetID = targetID
+        self.targetX, self.targetY = graph.getPosition(targetID)
+
+        nodeCount = graph.nodeCount
+        self.closedSet = [False] * nodeCount
+        self.gScore = [1E400] * nodeCount
+        self.cameFrom = [-1] * nodeCount
+        self.gScore[self.sourceID] = 0
+        self.openSet = [(self.heuristic(self.sourceID), self.sourceID)]
+
+    def heuristic(self, nodeID):
+        return self.graph.distanceTo(nodeID, self.targetX, self.targetY)
+
+    def step(self, maxExpansions):
+        if self.status != PENDING:
+            return self.status
+        offsets = self.graph.offsets
+        neighborIDs = self.graph.neighborIDs
+        lengths = self.graph.lengths
+        gScore = self.gScore
+        expansions = 0
+        while expansions < maxExpansions:
+            if not self.openSet:
+                self.status = FAILED
+                return self.status
+            currentFScore, currentID = heapq.heappop(self.openSet)
+            if self.closedSet[currentID]:
+                continue
+            expansions += 1
+            self.expanded += 1
+            if len(self.openSet) >= self.openSetPeak:
+                self.openSetPeak = len(self.openSet) + 1
+            if currentID == self.targetID:
+                self.pathIDs = self.reconstructPath()
+                self.status = DONE
+                return self.status
+            self.closedSet[currentID] = True
+            for edge in range(offsets[currentID], offsets[currentID + 1]):
+                neighborID = neighborIDs[edge]
+                if self.closedSet[neighborID]:
+                    continue
+                neighborGScore = gScore[currentID] + lengths[edge]
+                if neighborGScore < gScore[neighborID]:
+                    gScore[neighborID] = neighborGScore
+                    self.cameFrom[neighborID] = currentID
+                    heapq.heappush(self.openSet, (neighborGScore + self.heuristic(neighborID), neighborID))
+        return self.status
+
+    def reconstructPath(self):
+        nodeID = self.targetID
+        path = [nodeID]
+        while nodeID != self.sourceID:
+            nodeID = self.cameFrom[nodeID]
+            path.append(nodeID)
+        path.reverse()
+        return path
+
+
+class PathScheduler():
+    """
+    Runs PathSearches a slice at a time so that many agents replanning in the
+    same frame can't blow the frame time. update() is called once per frame and
+    shares expansionsPerFrame between the searches that are waiting, starting
+    with a different one each frame so nobody starves.
+    """
+
+    def __init__(self, expansionsPerFrame = 200):
+        self.expansionsPerFrame = expansionsPerFrame
+        self.requests = []
+
+    def submit(self, search, callback):
+        """callback(search) is called from update() once the search is DONE or FAILED."""
+        self.requests.append((search, callback))
+        return search
+
+    def cancel(self, search):
+        self.requests = [request for request in self.requests if request[0] is not search]
+
+    def update(self):
+        budget = self.expansionsPerFrame
+        served = []
+        finished = []
+        for request in self.requests:
+            if budget <= 0:
+                break
+            search, callback = request
+            share = max(budget // (len(self.requests) - len(served)), 1)
+            before = search.expanded
+            if search.step(share) != PENDING:
+                finished.append(request)
+            budget -= search.expanded - before
+            served.append(request)
+        #Whoever was served goes to the back of the line
+        self.requests = [request for request in self.requests[len(served):] + served if request not in finished]
+        for search, callback in finished:
+            callback(search)
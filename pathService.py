@@ -0,0 +1,133 @@
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class GraphSnapshot():
+    """
+    The CompactGraph of a WaypointGraph, with the IDs its waypoints use. It holds
+    no NodePaths and is never changed, so the path service's worker thread can
+    search it while the game keeps running.
+    """
+    isValid = True
+
+    def __init__(self, graph):
+        if not graph.isValid:
+            graph.build()
+        self.compact = graph.compact
+        self.nodeIDs = tuple([waypoint.ID for waypoint in graph.waypoints])
+
+    def getClosestVisible(self, position, wallMap):
+        """Returns the ID of the closest waypoint with a clear line from position, or None."""
+        x, y = position
+        candidates = [(self.compact.distanceTo(nodeID, x, y), nodeID) for nodeID in self.nodeIDs]
+        candidates.sort()
+        for distance, nodeID in candidates:
+            if wallMap.isClear(position, self.compact.getPosition(nodeID)):
+                return nodeID
+        return None
+
+
+def stringPull(start, pathIDs, graph, wallMap):
+    """
+    Shortens a path by skipping ahead, from start and then from each waypoint we
+    keep, to the furthest waypoint along the path that is in plain sight.
+    """
+    smoothed = []
+    current = start
+    i = 0
+    while i < len(pathIDs):
+        furthest = i
+        for j in range(len(pathIDs) - 1, i, -1):
+            if wallMap.isClear(current, graph.getPosition(pathIDs[j])):
+                furthest = j
+                break
+        smoothed.append(pathIDs[furthest])
+        current = graph.getPosition(pathIDs[furthest])
+        i = furthest + 1
+    return smoothed
+
+def planPath(snapshot, wallMap, source, target, smooth):
+    """
+    Finds the waypoint IDs to follow from source to target, both (x, y), or None.
+    This is everything AStar does, without touching the scene graph.
+    """
+    sourceID = snapshot.getClosestVisible(source, wallMap)
+    targetID = snapshot.getClosestVisible(target, wallMap)
+    if sourceID is None or targetID is None:
+        return None
+    pathIDs = snapshot.compact.findPath(sourceID, targetID)
+    if pathIDs is not None and smooth:
+        return stringPull(source, pathIDs, snapshot.compact, wallMap)
+    return pathIDs
+
+
+class PathRequest():
+    def __init__(self, roomKey, source, target, callback, smooth):
+        self.roomKey = roomKey
+        self.source = source
+        self.target = target
+        self.callback = callback
+        self.smooth = smooth
+        self.cancelled = False
+        self.pathIDs = None
+
+
+class PathService():
+    """
+    Plans paths on a worker thread. request() queues a PathRequest and returns
+    right away; update(), called once a frame from the main thread, hands
+    finished requests to their callbacks. Rooms are registered with setRoom as
+    a GraphSnapshot and a WallMap, which are never changed once registered.
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.requests = queue.Queue()
+        self.responses = queue.Queue()
+        self.thread = None
+
+    def setRoom(self, roomKey, snapshot, wallMap):
+        self.rooms[roomKey] = (snapshot, wallMap)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.run, name = "path service")
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def request(self, roomKey, source, target, callback, smooth = False):
+        self.start()
+        request = PathRequest(roomKey, source, target, callback, smooth)
+        self.requests.put(request)
+        return request
+
+    def cancel(self, request):
+        request.cancelled = True
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            if request.cancelled:
+                continue
+            snapshot, wallMap = self.rooms[request.roomKey]
+            request.pathIDs = planPath(snapshot, wallMap, request.source, request.target, request.smooth)
+            self.responses.put(request)
+
+    def update(self):
+        while True:
+            try:
+                request = self.responses.get_nowait()
+            except queue.Empty:
+                return
+            if not request.cancelled:
+                request.callback(request, request.pathIDs)
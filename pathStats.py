@@ -0,0 +1,82 @@
+import time
+
+# The best clock this Python has for timing short intervals
+clock = getattr(time, "perf_counter", time.time)
+
+class PathStats():
+    """
+    Counters and timers for the path finder, kept per agent for each frame.
+
+    PathFinder adds to them as it works, on behalf of whichever agent setAgent
+    last named. endFrame, called once a frame, keeps that frame's numbers as
+    lastFrame and adds them to the totals. Nothing is counted unless enabled
+    is set, and callers check enabled before calling in, so it costs one
+    attribute lookup per call site when it's off.
+
+    Counters that end in "Peak" keep the largest value seen instead of a sum.
+    """
+
+    counterNames = ("aStarCalls", "nodesExpanded", "openSetPeak", "closestLookups",
+                    "rayCasts", "wallMapChecks", "traversalTime")
+
+    def __init__(self):
+        self.enabled = False
+        self.agent = None
+        self.reset()
+
+    def reset(self):
+        self.frameCount = 0
+        self.frame = {}
+        self.lastFrame = {}
+        self.totals = {}
+
+    def setAgent(self, agent):
+        """Counts what follows against agent, a name. None is for work no agent asked for."""
+        self.agent = agent
+
+    def add(self, name, value = 1):
+        counters = self.frame.get(self.agent)
+        if counters is None:
+            counters = self.frame[self.agent] = dict.fromkeys(self.counterNames, 0)
+        if name.endswith("Peak"):
+            counters[name] = max(counters[name], value)
+        else:
+            counters[name] += value
+
+    def endFrame(self):
+        if not self.enabled:
+            return
+        self.frameCount += 1
+        for agent, counters in self.frame.items():
+            totals = self.totals.setdefault(agent, dict.fromkeys(self.counterNames, 0))
+            for name, value in counters.items():
+                if name.endswith("Peak"):
+                    totals[name] = max(totals[name], value)
+                else:
+                    totals[name] += value
+        self.lastFrame = self.frame
+        self.frame = {}
+        self.agent = None
+
+    def snapshot(self):
+        """
+        Returns copies of the numbers, as {"frameCount":n, "lastFrame":{agent:counters},
+        "totals":{agent:counters}}, where counters is {counterName:value}.
+        """
+        def copy(byAgent):
+            return dict([(agent, dict(counters)) for agent, counters in byAgent.items()])
+        return {"frameCount":self.frameCount, "lastFrame":copy(self.lastFrame), "totals":copy(self.totals)}
+
+    def format(self):
+        """The last frame's numbers as text, a line per agent."""
+        lines = ["path finding, frame " + str(self.frameCount)]
+        for agent in sorted(self.lastFrame.keys(), key = str):
+            counters = self.lastFrame[agent]
+            lines.append("%s: %d A*, %d expanded, %d open peak, %d closest, %d rays, %d wall map, %.2f ms traversing" %
+                         (agent or "other", counters["aStarCalls"], counters["nodesExpanded"], counters["openSetPeak"],
+                          counters["closestLookups"], counters["rayCasts"], counters["wallMapChecks"],
+                          1000.0 * counters["traversalTime"]))
+        return "\n".join(lines)
+
+
+pathStats = PathStats()
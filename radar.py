@@ -0,0 +1,68 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def radarActivations(npcPositions, npcHeadings, agentPositions, slices, radarLengths, pairs = None):
+    """
+    Does NPC.radarSense for many NPCs at once and returns the activation levels as
+    an (NPCs, slices) array of counts. Needs numpy.
+
+    npcPositions and agentPositions are (n, 3) arrays of positions in render, and
+    npcHeadings what getH() returned, in degrees. The NPCs must share their number
+    of slices, but each has its own radarLength. The arithmetic follows radarSense
+    step by step, so the answers are the same. The positions are differenced and
+    measured in 32 bit floats, as Panda's Vec3 does. The angle is turned into
+    [0, 2 pi) by subtracting 2 pi one turn at a time, as radarSense's while loops do.
+
+    Every NPC is checked against every agent unless pairs, a list of (NPC index,
+    agent index), says which ones are worth checking, such as those a SpatialHash
+    found near each NPC.
+    """
+    #One contiguous row per axis, which numpy broadcasts faster than columns
+    npcAxes = numpy.ascontiguousarray(numpy.asarray(npcPositions, dtype = numpy.float32).reshape(-1, 3).T)
+    agentAxes = numpy.ascontiguousarray(numpy.asarray(agentPositions, dtype = numpy.float32).reshape(-1, 3).T)
+    npcCount = npcAxes.shape[1]
+    radarLengths = numpy.asarray(radarLengths, dtype = numpy.float64)
+    #Comparing with the largest 32 bit float no bigger than each radarLength gives the
+    #same answers as comparing in 64 bits, without converting every length
+    limits = radarLengths.astype(numpy.float32)
+    limits = numpy.where(limits > radarLengths, numpy.nextafter(limits, numpy.float32(-numpy.inf)), limits)
+    if pairs is None:
+        #Rows are NPCs and columns are agents
+        x = agentAxes[0] - npcAxes[0][:, numpy.newaxis]
+        y = agentAxes[1] - npcAxes[1][:, numpy.newaxis]
+        z = agentAxes[2] - npcAxes[2][:, numpy.newaxis]
+        lengths = numpy.sqrt(x * x + y * y + z * z)
+        npcIndices, agentIndices = numpy.nonzero(lengths <= limits[:, numpy.newaxis])
+        x = x[npcIndices, agentIndices]
+        y = y[npcIndices, agentIndices]
+    else:
+        pairs = numpy.asarray(pairs, dtype = numpy.int64).reshape(-1, 2)
+        npcIndices, agentIndices = pairs[:, 0], pairs[:, 1]
+        x = agentAxes[0][agentIndices] - npcAxes[0][npcIndices]
+        y = agentAxes[1][agentIndices] - npcAxes[1][npcIndices]
+        z = agentAxes[2][agentIndices] - npcAxes[2][npcIndices]
+        inRange = numpy.sqrt(x * x + y * y + z * z) <= limits[npcIndices]
+        npcIndices, x, y = npcIndices[inRange], x[inRange], y[inRange]
+
+    #Only the agents in range need an angle
+    x = x.astype(numpy.float64)
+    y = y.astype(numpy.float64)
+    #Straight up or down the Y axis is a special case, and no offset at all counts as straight up
+    angles = numpy.where(x == 0, numpy.where(y < 0, 3. * numpy.pi / 2, numpy.pi / 2), numpy.arctan2(y, x))
+    angles -= (numpy.asarray(npcHeadings, dtype = numpy.float64) * (numpy.pi / 180.0))[npcIndices]
+    fullTurn = 2. * numpy.pi
+    while True:
+        tooBig = angles >= fullTurn
+        if not tooBig.any():
+            break
+        angles[tooBig] -= fullTurn
+    while True:
+        tooSmall = angles < 0.0
+        if not tooSmall.any():
+            break
+        angles[tooSmall] += fullTurn
+
+    orthants = slices - (slices * angles / fullTurn).astype(numpy.int64) - 1
+    return numpy.bincount(npcIndices * slices + orthants, minlength = npcCount * slices).reshape(npcCount, slices)
@@ -0,0 +1,183 @@
+import heapq
+import math
+from flowField import FlowField
+
+class PortalTrees():
+    """
+    Shortest path trees inside one room for one of its portal nodes: the way to
+    the portal from every node (a FlowField) and the way from it to every node.
+    """
+
+    def __init__(self, graph, nodeID):
+        infinity = 1E400
+        self.toPortal = FlowField(graph)
+        self.toPortal.setGoal(nodeID)
+        compact = graph.compact
+        self.costs = [infinity] * compact.nodeCount
+        self.cameFrom = [-1] * compact.nodeCount
+        self.costs[nodeID] = 0
+        openSet = [(0, nodeID)]
+        while openSet:
+            currentCost, currentID = heapq.heappop(openSet)
+            if currentCost > self.costs[currentID]:
+                continue
+            for edge in range(compact.offsets[currentID], compact.offsets[currentID + 1]):
+                neighborID = compact.neighborIDs[edge]
+                neighborCost = currentCost + compact.lengths[edge]
+                if neighborCost < self.costs[neighborID]:
+                    self.costs[neighborID] = neighborCost
+                    self.cameFrom[neighborID] = currentID
+                    heapq.heappush(openSet, (neighborCost, neighborID))
+
+    def costTo(self, nodeID):
+        return self.toPortal.costs[nodeID]
+
+    def costFrom(self, nodeID):
+        return self.costs[nodeID]
+
+    def pathTo(self, nodeID):
+        """Node IDs from nodeID to the portal, both included."""
+        path = [nodeID]
+        while path[-1] != self.toPortal.goalID:
+            path.append(self.toPortal.getNextID(path[-1]))
+        return path
+
+    def pathFrom(self, nodeID):
+        """Node IDs from the portal to nodeID, both included."""
+        path = [nodeID]
+        while self.cameFrom[path[-1]] != -1:
+            path.append(self.cameFrom[path[-1]])
+        path.reverse()
+        return path
+
+
+class RoomPlanner():
+    """
+    Plans paths across rooms in the style of HPA*. Each room is a cluster with its
+    own WaypointGraph, and each gate is a portal that joins a node in one room to
+    a node in another. The cost between every pair of portal nodes in a room is
+    precomputed, so a query only searches the small graph of portal nodes (plus
+    its two ends) and then fills in the legs inside each room from stored trees.
+
+    Steps in a path are (roomKey, nodeID). Waypoint positions of every room must be
+    in the same coordinates, since they are used for the search's heuristic.
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.portals = []
+        self.isValid = False
+
+    def addRoom(self, roomKey, graph):
+        self.rooms[roomKey] = graph
+        self.isValid = False
+
+    def addPortal(self, roomKey, nodeID, otherRoomKey, otherNodeID, cost, data = None):
+        """Joins the two nodes both ways. data is handed back for each crossing by getPortalData."""
+        self.portals.append(((roomKey, nodeID), (otherRoomKey, otherNodeID), cost, data))
+        self.isValid = False
+
+    def build(self):
+        self.portalNodes = {}
+        self.crossings = {}
+        self.portalData = {}
+        for roomKey, graph in self.rooms.items():
+            if not graph.isValid:
+                graph.build()
+            self.portalNodes[roomKey] = {}
+        for first, second, cost, data in self.portals:
+            for node, otherNode in ((first, second), (second, first)):
+                roomKey, nodeID = node
+                if nodeID not in self.portalNodes[roomKey]:
+                    self.portalNodes[roomKey][nodeID] = PortalTrees(self.rooms[roomKey], nodeID)
+                self.crossings.setdefault(node, []).append((otherNode, cost))
+                self.portalData[(node, otherNode)] = data
+
+        #The abstract graph: portal nodes, linked through their rooms and across their gates
+        self.edges = {}
+        for roomKey, trees in self.portalNodes.items():
+            for nodeID in trees:
+                edges = []
+                for otherID, otherTrees in trees.items():
+                    if otherID != nodeID and otherTrees.costTo(nodeID) < 1E400:
+                        edges.append(((roomKey, otherID), otherTrees.costTo(nodeID)))
+                edges.extend(self.crossings[(roomKey, nodeID)])
+                self.edges[(roomKey, nodeID)] = edges
+        self.isValid = True
+
+    def getPortalData(self, step, nextStep):
+        return self.portalData.get((step, nextStep))
+
+    def getPosition(self, step):
+        roomKey, nodeID = step
+        return self.rooms[roomKey].compact.getPosition(nodeID)
+
+    def findPath(self, roomKey, nodeID, goalRoomKey, goalNodeID):
+        """
+        Returns the steps from (roomKey, nodeID) to (goalRoomKey, goalNodeID), both
+        included, or None if there is no way there.
+        """
+        if not self.isValid:
+            self.build()
+        start = (roomKey, nodeID)
+        goal = (goalRoomKey, goalNodeID)
+        if roomKey == goalRoomKey:
+            pathIDs = self.rooms[roomKey].compact.findPath(nodeID, goalNodeID)
+            if pathIDs is None:
+                return None
+            return [(roomKey, pathID) for pathID in pathIDs]
+
+        goalX, goalY = self.getPosition(goal)
+        def heuristic(step):
+            x, y = self.getPosition(step)
+            return math.hypot(goalX - x, goalY - y)
+
+        #Only the start, the goal and the portal nodes are searched; the start and goal
+        #are joined to their own room's portal nodes with the precomputed trees
+        startEdges = [((roomKey, portalID), trees.costTo(nodeID))
+                      for portalID, trees in self.portalNodes.get(roomKey, {}).items()]
+        goalTrees = self.portalNodes.get(goalRoomKey, {})
+        gScore = {start:0}
+        cameFrom = {start:None}
+        closedSet = set()
+        openSet = [(heuristic(start), start)]
+        while openSet:
+            currentFScore, current = heapq.heappop(openSet)
+            if current in closedSet:
+                continue
+            if current == goal:
+                return self.refinePath(cameFrom, goal)
+            closedSet.add(current)
+            edges = list(self.edges.get(current, ()))
+            if current == start:
+                edges.extend(startEdges)
+            if current[0] == goalRoomKey and current[1] in goalTrees:
+                edges.append((goal, goalTrees[current[1]].costFrom(goalNodeID)))
+            for neighbor, cost in edges:
+                if neighbor in closedSet or cost >= 1E400:
+                    continue
+                neighborGScore = gScore[current] + cost
+                if neighborGScore < gScore.get(neighbor, 1E400):
+                    gScore[neighbor] = neighborGScore
+                    cameFrom[neighbor] = current
+                    heapq.heappush(openSet, (neighborGScore + heuristic(neighbor), neighbor))
+        return None
+
+    def refinePath(self, cameFrom, goal):
+        """Fills in the waypoints inside each room between the portal nodes we went through."""
+        abstractPath = [goal]
+        while cameFrom[abstractPath[-1]] is not None:
+            abstractPath.append(cameFrom[abstractPath[-1]])
+        abstractPath.reverse()
+        path = [abstractPath[0]]
+        for i in range(1, len(abstractPath)):
+            (roomKey, nodeID), (nextRoomKey, nextNodeID) = abstractPath[i - 1], abstractPath[i]
+            if roomKey != nextRoomKey:
+                path.append((nextRoomKey, nextNodeID))
+            elif nextNodeID in self.portalNodes[roomKey]:
+                leg = self.portalNodes[roomKey][nextNodeID].pathTo(nodeID)
+                path.extend([(roomKey, legID) for legID in leg[1:]])
+            else:
+                leg = self.portalNodes[roomKey][nodeID].pathFrom(nextNodeID)
+                path.extend([(roomKey, legID) for legID in leg[1:]])
+        return path
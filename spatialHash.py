@@ -0,0 +1,115 @@
+import heapq
+import math
+
+def ringCells(centerX, centerY, ring):
+    """Yields the cells on the square ring at the given distance from the center cell."""
+    if ring == 0:
+        yield (centerX, centerY)
+        return
+    for cellX in range(centerX - ring, centerX + ring + 1):
+        yield (cellX, centerY - ring)
+        yield (cellX, centerY + ring)
+    for cellY in range(centerY - ring + 1, centerY + ring):
+        yield (centerX - ring, cellY)
+        yield (centerX + ring, cellY)
+
+class SpatialHash():
+    """
+    Agent positions bucketed into a uniform grid of square cells over XY, so a
+    proximity query only looks at the cells around it instead of every agent.
+
+    update() rebuilds the buckets from scratch, and is meant to be called once a
+    frame with every agent's position. Queries then answer from that snapshot, so
+    an agent that moves later in the frame is found where it was at update().
+    Distances are measured in 3D, like Vec3.length().
+    """
+
+    def __init__(self, cellSize):
+        self.cellSize = float(cellSize)
+        self.cells = {}
+        self.positions = {}
+
+    def update(self, items):
+        """items is a list of (key, (x, y, z)). Keys must be hashable, and are what queries return."""
+        self.cells = {}
+        self.positions = {}
+        for key, position in items:
+            x, y, z = position
+            self.positions[key] = (x, y, z)
+            self.cells.setdefault(self.cellOf(x, y), []).append((key, x, y, z))
+
+    def cellOf(self, x, y):
+        return (int(math.floor(x / self.cellSize)), int(math.floor(y / self.cellSize)))
+
+    def getPosition(self, key):
+        """Where key was at the last update, or None if it wasn't there."""
+        return self.positions.get(key)
+
+    def getCandidates(self, position, radius):
+        """
+        Returns (key, x, y, z) for everything in the cells that a circle of radius
+        around position touches. That's everything within radius and then some,
+        for callers that want to measure the distances their own way.
+        """
+        x, y = position[0], position[1]
+        minCellX, minCellY = self.cellOf(x - radius, y - radius)
+        maxCellX, maxCellY = self.cellOf(x + radius, y + radius)
+        #A radius that covers more cells than there are buckets is quicker to answer from the buckets
+        if (maxCellX - minCellX + 1) * (maxCellY - minCellY + 1) > len(self.cells):
+            candidates = []
+            for (cellX, cellY), entries in self.cells.items():
+                if minCellX <= cellX <= maxCellX and minCellY <= cellY <= maxCellY:
+                    candidates.extend(entries)
+            return candidates
+        candidates = []
+        for cellX in range(minCellX, maxCellX + 1):
+            for cellY in range(minCellY, maxCellY + 1):
+                candidates.extend(self.cells.get((cellX, cellY), ()))
+        return candidates
+
+    def queryRadius(self, position, radius):
+        """Returns (distance, key) for everything within radius of position, nearest first."""
+        x, y, z = position
+        found = []
+        for key, otherX, otherY, otherZ in self.getCandidates(position, radius):
+            distance = math.sqrt((otherX - x) ** 2 + (otherY - y) ** 2 + (otherZ - z) ** 2)
+            if distance <= radius:
+                found.append((distance, key))
+        found.sort(key = lambda entry: entry[0])
+        return found
+
+    def kNearest(self, position, k, maxRadius = None):
+        """
+        Returns (distance, key) for the k nearest things to position, nearest first,
+        leaving out anything further than maxRadius. The cells are searched in square
+        rings outward until k are found that nothing unsearched could beat.
+        """
+        if k <= 0 or not self.cells:
+            return []
+        x, y, z = position
+        centerX, centerY = self.cellOf(x, y)
+        #Rings beyond this can't hold anything
+        maxRing = 0
+        for cellX, cellY in self.cells:
+            maxRing = max(maxRing, abs(cellX - centerX), abs(cellY - centerY))
+        if maxRadius is not None:
+            maxRing = min(maxRing, int(math.ceil(maxRadius / self.cellSize)) + 1)
+        candidates = []
+        found = []
+        #Breaks ties between equal distances without comparing keys
+        order = 0
+        for ring in range(maxRing + 1):
+            for cell in ringCells(centerX, centerY, ring):
+                for key, otherX, otherY, otherZ in self.cells.get(cell, ()):
+                    distance = math.sqrt((otherX - x) ** 2 + (otherY - y) ** 2 + (otherZ - z) ** 2)
+                    if maxRadius is None or distance <= maxRadius:
+                        heapq.heappush(candidates, (distance, order, key))
+                        order += 1
+            #Anything in a cell past this ring is at least this far away in XY
+            searchedRadius = ring * self.cellSize
+            while candidates and len(found) < k and (candidates[0][0] <= searchedRadius or ring == maxRing):
+                distance, entryOrder, key = heapq.heappop(candidates)
+                found.append((distance, key))
+            if len(found) >= k:
+                break
+        return found
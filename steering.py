@@ -0,0 +1,154 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# NPC.wander's numbers
+wanderCircleRadius = 2.5
+wanderDistance = 5.0
+wanderJitter = 50.
+wanderInterval = 5
+
+class SteeringCore():
+    """
+    NPC.seek and NPC.wander for many NPCs at once, kept as a struct of arrays.
+
+    Each frame the NPCs ask for seek(index, x, y) or wander(index), or one of each,
+    instead of moving themselves, and step() then works out every turn and move
+    together. It makes the same decisions, in the same order, as the per NPC methods:
+
+      seek     moves forward first if the target is 45 to 135 degrees around, then
+               turns toward it. It does nothing if already on top of it.
+      wander   every wanderInterval calls nudges its wander target by a random
+               jitter, then turns toward the target and moves forward.
+
+    moveForward is setFluidY(self, -distance), so with heading h a move goes
+    distance * scale * (sin h, -cos h). turnLeft adds to the heading and turnRight
+    takes away. The wander targets are Vec2s in the per NPC code, so they are kept
+    in 32 bit floats here. Needs numpy.
+    """
+
+    def __init__(self, speeds, turnRates, scales, wanderTargets, callCounts):
+        self.speeds = numpy.array(speeds, dtype = numpy.float64)
+        self.turnRates = numpy.array(turnRates, dtype = numpy.float64)
+        self.scales = numpy.array(scales, dtype = numpy.float64)
+        self.wanderTargets = numpy.array(wanderTargets, dtype = numpy.float32).reshape(-1, 2)
+        self.callCounts = numpy.array(callCounts, dtype = numpy.int64)
+        #An NPC can ask for both in one frame, as act does when a wander turns into a seek
+        self.wanderRequests = numpy.zeros(len(self.speeds), dtype = bool)
+        self.seekRequests = numpy.zeros(len(self.speeds), dtype = bool)
+        #Whether the seek was asked for before the wander, for those that asked for both
+        self.seekFirst = numpy.zeros(len(self.speeds), dtype = bool)
+        self.targets = numpy.zeros((len(self.speeds), 2), dtype = numpy.float64)
+
+    def seek(self, index, x, y):
+        #There's one target per NPC, so a second seek would replace the first instead of
+        #following it. NPC.act asks for one at most.
+        assert not self.seekRequests[index], "NPC " + str(index) + " asked to seek twice in one step"
+        self.seekRequests[index] = True
+        self.seekFirst[index] = not self.wanderRequests[index]
+        self.targets[index] = (x, y)
+
+    def wander(self, index):
+        assert not self.wanderRequests[index], "NPC " + str(index) + " asked to wander twice in one step"
+        self.wanderRequests[index] = True
+
+    def getRequested(self):
+        """The indices of the NPCs that asked to seek or wander since the last step."""
+        return numpy.nonzero(self.wanderRequests | self.seekRequests)[0]
+
+    def getWanderState(self, index):
+        """Returns the wander target's x and y and the wander call count for index."""
+        return float(self.wanderTargets[index, 0]), float(self.wanderTargets[index, 1]), int(self.callCounts[index])
+
+    def setWanderState(self, index, x, y, callCount):
+        self.wanderTargets[index] = (x, y)
+        self.callCounts[index] = callCount
+
+    def getJitterDue(self):
+        """The indices, in order, of the NPCs whose wander draws a jitter this step."""
+        return numpy.nonzero(self.wanderRequests & (self.callCounts + 1 == wanderInterval))[0]
+
+    def step(self, positions, headings, elapsedTime, jitters):
+        """
+        Turns and moves every NPC that asked to this frame, and forgets the requests.
+        An NPC that asked for both a seek and a wander does both, in the order it asked.
+
+        positions is an (n, 2) array of where the NPCs are and headings their H, in
+        degrees. elapsedTime is the time the step covers, for all of them or one each.
+        jitters has an (x, y) for each index getJitterDue() gave, in the same order, as
+        NPC.drawJitters draws them. Returns the new positions and headings, and an
+        (n, 2) array of what each NPC's first and second request did: 1 if it moved,
+        0 if it stopped and -1 if there was no such request.
+        """
+        positions = numpy.array(positions, dtype = numpy.float64).reshape(-1, 2)
+        headings = numpy.array(headings, dtype = numpy.float64)
+        elapsedTime = numpy.asarray(elapsedTime, dtype = numpy.float64)
+        turnAngles = self.turnRates * elapsedTime
+        distances = self.speeds * elapsedTime
+        seekBefore = self.seekRequests & self.seekFirst
+        seekAfter = self.seekRequests & ~self.seekFirst
+        wandering = self.wanderRequests
+
+        moving = numpy.full((len(self.speeds), 2), -1, dtype = numpy.int8)
+        seekMoving = self.stepSeek(positions, headings, turnAngles, distances, seekBefore)
+        moving[seekBefore, 0] = seekMoving[seekBefore]
+        self.stepWander(positions, headings, turnAngles, distances, wandering, jitters)
+        moving[wandering & ~seekBefore, 0] = 1
+        moving[wandering & seekBefore, 1] = 1
+        seekMoving = self.stepSeek(positions, headings, turnAngles, distances, seekAfter)
+        moving[seekAfter & ~wandering, 0] = seekMoving[seekAfter & ~wandering]
+        moving[seekAfter & wandering, 1] = seekMoving[seekAfter & wandering]
+
+        self.wanderRequests[:] = False
+        self.seekRequests[:] = False
+        return positions, headings, moving
+
+    def stepSeek(self, positions, headings, turnAngles, distances, seeking):
+        """Seek for the NPCs picked by seeking, in place. Returns which of them had somewhere to go."""
+        #From the heading we start with
+        worldHeadings = headings % 360
+        xDirections = self.targets[:, 0] - positions[:, 0]
+        yDirections = self.targets[:, 1] - positions[:, 1]
+        directionsToTarget = numpy.degrees(numpy.arctan2(yDirections, xDirections))
+        seekMoving = seeking & ((xDirections != 0) | (yDirections != 0))
+        anglesToTarget = (directionsToTarget - worldHeadings + 180) % 360
+        seekForward = seekMoving & (45 <= anglesToTarget) & (anglesToTarget <= 135)
+        seekLeft = seekMoving & (90 <= anglesToTarget) & (anglesToTarget < 270)
+        seekRight = seekMoving & (((0 <= anglesToTarget) & (anglesToTarget < 90)) |
+                                  ((270 <= anglesToTarget) & (anglesToTarget < 360)))
+        self.move(positions, headings, distances, seekForward)
+        headings[seekLeft] += turnAngles[seekLeft]
+        headings[seekRight] -= turnAngles[seekRight]
+        return seekMoving
+
+    def stepWander(self, positions, headings, turnAngles, distances, wandering, jitters):
+        """Wander for the NPCs picked by wandering, in place."""
+        self.callCounts[wandering] += 1
+        due = wandering & (self.callCounts == wanderInterval)
+        if due.any():
+            targets = self.wanderTargets[due] + numpy.asarray(jitters, dtype = numpy.float32).reshape(-1, 2)
+            #Vec2.normalize leaves a zero vector alone
+            lengthsSquared = targets[:, 0] * targets[:, 0] + targets[:, 1] * targets[:, 1]
+            lengths = numpy.where(lengthsSquared == 0, numpy.float32(1), numpy.sqrt(lengthsSquared))
+            targets /= lengths[:, numpy.newaxis]
+            targets *= numpy.float32(wanderCircleRadius)
+            self.wanderTargets[due] = targets
+            self.callCounts[due] = 0
+        thetas = numpy.arctan2(self.wanderTargets[:, 1].astype(numpy.float64), self.wanderTargets[:, 0].astype(numpy.float64))
+        relativeXs = wanderCircleRadius * numpy.cos(thetas)
+        relativeYs = (wanderCircleRadius * numpy.sin(thetas)) - wanderDistance
+        degreesHeadings = numpy.degrees(numpy.arctan2(relativeYs, relativeXs))
+        wanderLeft = wandering & (-90.0 < degreesHeadings) & (degreesHeadings <= 0.0)
+        wanderRight = wandering & ~wanderLeft
+        headings[wanderLeft] += turnAngles[wanderLeft]
+        headings[wanderRight] -= turnAngles[wanderRight]
+        #Wander moves after it turns
+        self.move(positions, headings, distances, wandering)
+
+    def move(self, positions, headings, distances, which):
+        """moveForward for the NPCs picked by which, in place."""
+        radians = numpy.radians(headings[which])
+        scaledDistances = distances[which] * self.scales[which]
+        positions[which, 0] += scaledDistances * numpy.sin(radians)
+        positions[which, 1] -= scaledDistances * numpy.cos(radians)
@@ -0,0 +1,127 @@
+"""
+Synthetic waypoint graphs, without Panda3D, for the path finding benchmark and
+the unit tests. Each generator takes a node count and a random.Random and returns
+(positions, adjacency, walls):
+
+    geometric   random points, linked to every point within a fixed radius
+    grid        a square grid, linked to the four points around each point
+    maze        a square grid of cells with a corridor maze carved through it,
+                and a wall between every pair of cells it doesn't link
+
+makeWaypoints turns one into waypoints that WaypointGraph can take.
+"""
+import math
+from compactGraph import CompactGraph
+from waypointGraph import WaypointGraph
+
+class SyntheticWaypoint():
+    """Just enough of a Waypoint for WaypointGraph, without the NodePath."""
+
+    def __init__(self, x, y, ID):
+        self.x = x
+        self.y = y
+        self.ID = ID
+        self.neighbors = []
+        self.graph = None
+
+    def getNeighbors(self):
+        return self.neighbors
+
+
+class NearestIndex(WaypointGraph):
+    """A WaypointGraph with only its grid, for graphs too big for the all pairs table."""
+
+    def build(self):
+        self.compact = CompactGraph.fromWaypoints(self.waypoints, self.position, self.distance)
+        self.waypointsByID = self.waypoints
+        self.buildGrid()
+        self.isValid = True
+
+
+def position(thing):
+    return (thing.x, thing.y)
+
+def distance(source, target):
+    return math.hypot(target.x - source.x, target.y - source.y)
+
+def geometricGraph(nodeCount, rng):
+    """Points at a density of one per unit square, linked within a radius that gives about 6 links each."""
+    side = math.sqrt(nodeCount)
+    radius = math.sqrt(6.0 / math.pi)
+    positions = [(rng.uniform(0, side), rng.uniform(0, side)) for i in range(nodeCount)]
+    cells = {}
+    for nodeID in range(nodeCount):
+        x, y = positions[nodeID]
+        cells.setdefault((int(x / radius), int(y / radius)), []).append(nodeID)
+    adjacency = [[] for i in range(nodeCount)]
+    for nodeID in range(nodeCount):
+        x, y = positions[nodeID]
+        cellX, cellY = int(x / radius), int(y / radius)
+        for otherCellX in (cellX - 1, cellX, cellX + 1):
+            for otherCellY in (cellY - 1, cellY, cellY + 1):
+                for otherID in cells.get((otherCellX, otherCellY), ()):
+                    otherX, otherY = positions[otherID]
+                    if otherID != nodeID and math.hypot(otherX - x, otherY - y) <= radius:
+                        adjacency[nodeID].append(otherID)
+    return positions, adjacency, []
+
+def gridGraph(nodeCount, rng):
+    side = max(int(round(math.sqrt(nodeCount))), 1)
+    positions = [(column, row) for row in range(side) for column in range(side)]
+    adjacency = [[] for i in range(len(positions))]
+    for row in range(side):
+        for column in range(side):
+            nodeID = row * side + column
+            if column + 1 < side:
+                adjacency[nodeID].append(nodeID + 1)
+                adjacency[nodeID + 1].append(nodeID)
+            if row + 1 < side:
+                adjacency[nodeID].append(nodeID + side)
+                adjacency[nodeID + side].append(nodeID)
+    return positions, adjacency, []
+
+def mazeGraph(nodeCount, rng):
+    """
+    A maze carved through a grid of unit cells with a randomized depth first search,
+    so there is exactly one way between any two cells. Returns the walls as well.
+    """
+    side = max(int(round(math.sqrt(nodeCount))), 1)
+    positions = [(column + 0.5, row + 0.5) for row in range(side) for column in range(side)]
+    adjacency = [[] for i in range(len(positions))]
+    visited = [False] * len(positions)
+    visited[0] = True
+    stack = [0]
+    while stack:
+        nodeID = stack[-1]
+        row, column = divmod(nodeID, side)
+        unvisited = []
+        for otherRow, otherColumn in ((row - 1, column), (row + 1, column), (row, column - 1), (row, column + 1)):
+            if 0 <= otherRow < side and 0 <= otherColumn < side and not visited[otherRow * side + otherColumn]:
+                unvisited.append(otherRow * side + otherColumn)
+        if not unvisited:
+            stack.pop()
+            continue
+        otherID = rng.choice(unvisited)
+        visited[otherID] = True
+        adjacency[nodeID].append(otherID)
+        adjacency[otherID].append(nodeID)
+        stack.append(otherID)
+
+    walls = [(0, 0, side, 0), (0, side, side, side), (0, 0, 0, side), (side, 0, side, side)]
+    for row in range(side):
+        for column in range(side):
+            nodeID = row * side + column
+            if column + 1 < side and nodeID + 1 not in adjacency[nodeID]:
+                walls.append((column + 1, row, column + 1, row + 1))
+            if row + 1 < side and nodeID + side not in adjacency[nodeID]:
+                walls.append((column, row + 1, column + 1, row + 1))
+    return positions, adjacency, walls
+
+graphKinds = {"geometric":geometricGraph, "grid":gridGraph, "maze":mazeGraph}
+
+def makeWaypoints(positions, adjacency):
+    """SyntheticWaypoints for a generated graph, linked to their neighbors."""
+    waypoints = [SyntheticWaypoint(positions[i][0], positions[i][1], i) for i in range(len(positions))]
+    for waypoint in waypoints:
+        waypoint.neighbors = [waypoints[neighborID] for neighborID in adjacency[waypoint.ID]]
+    return waypoints
@@ -0,0 +1,65 @@
+"""
+Checks which NPCs the AI scheduler ticks as the player moves between rooms.
+Run it with:
+
+    python -m unittest testAiScheduler
+"""
+import unittest
+from aiScheduler import AIScheduler
+
+class Carrier():
+    """Stands in for an NPC, which the scheduler only asks whether it's busy."""
+
+    def __init__(self):
+        self.carryingKey = False
+
+    def isBusy(self):
+        return self.carryingKey
+
+
+class AISchedulerTest(unittest.TestCase):
+
+    def ticked(self, scheduler, frames, elapsedTime = 0.25):
+        ticks = []
+        for frame in range(frames):
+            ticks.extend(scheduler.update(elapsedTime))
+        return ticks
+
+    def testThrottledRate(self):
+        scheduler = AIScheduler(inactiveRate = 2.0)
+        here, away = Carrier(), Carrier()
+        scheduler.addNPC(here, 1)
+        scheduler.addNPC(away, 2)
+        scheduler.playerEnteredRoom(1)
+        ticks = self.ticked(scheduler, 600, 1 / 60.0)
+        self.assertEqual(len([tick for tick in ticks if tick[0] is here]), 600)
+        self.assertEqual(len([tick for tick in ticks if tick[0] is away]), 20)
+
+    def testBusyNPCsStayAwake(self):
+        scheduler = AIScheduler(sleepInactive = True, isBusy = Carrier.isBusy)
+        carrier = Carrier()
+        scheduler.addNPC(carrier, 1)
+        scheduler.playerEnteredRoom(1)
+        self.ticked(scheduler, 5)
+        carrier.carryingKey = True
+        scheduler.playerLeftRoom(1)
+        self.assertEqual(self.ticked(scheduler, 30), [(carrier, 0.25, 0)] * 30)
+        #Once the key is home it sleeps with the rest of its room
+        carrier.carryingKey = False
+        self.assertEqual(self.ticked(scheduler, 30), [])
+        self.assertEqual(scheduler.playerEnteredRoom(1), [(carrier, 30)])
+        self.assertEqual(scheduler.update(0.25), [(carrier, 0.25, 0)])
+
+    def testWakingUp(self):
+        scheduler = AIScheduler(sleepInactive = True)
+        sleeper = Carrier()
+        scheduler.addNPC(sleeper, 1)
+        self.assertEqual(self.ticked(scheduler, 100), [])
+        self.assertEqual(scheduler.playerEnteredRoom(1), [(sleeper, 100)])
+        self.assertEqual(scheduler.playerEnteredRoom(1), [])
+        #The first tick covers just its own frame, not the time asleep
+        self.assertEqual(scheduler.update(0.5), [(sleeper, 0.5, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Checks the D* Lite planner against a fresh search on random geometric graphs,
+replanning as the goal and the start move. Run it with:
+
+    python -m unittest testDStarLite
+"""
+import random
+import unittest
+from dStarLite import DStarLite
+from syntheticGraphs import NearestIndex, distance, geometricGraph, makeWaypoints, position
+
+def makeGraph(nodeCount, rng):
+    positions, adjacency, walls = geometricGraph(nodeCount, rng)
+    waypoints = makeWaypoints(positions, adjacency)
+    graph = NearestIndex(waypoints, distance, position)
+    graph.build()
+    return graph, waypoints
+
+def pathLength(graph, pathIDs):
+    edges = [dict(graph.compact.getEdges(nodeID)) for nodeID in pathIDs[:-1]]
+    return sum([edges[i][pathIDs[i + 1]] for i in range(len(edges))])
+
+
+class DStarLiteTest(unittest.TestCase):
+
+    def checkReplans(self, moveStart):
+        rng = random.Random(7)
+        for trial in range(20):
+            graph, waypoints = makeGraph(120, rng)
+            planner = DStarLite(graph)
+            sourceID = rng.randrange(len(waypoints))
+            for replan in range(30):
+                if moveStart:
+                    sourceID = rng.randrange(len(waypoints))
+                targetID = rng.randrange(len(waypoints))
+                path = planner.plan(waypoints[sourceID], waypoints[targetID])
+                expected = graph.compact.findPath(sourceID, targetID)
+                if expected is None:
+                    self.assertEqual(path, None)
+                    continue
+                self.assertNotEqual(path, None)
+                pathIDs = [waypoint.ID for waypoint in path]
+                self.assertEqual(pathIDs[0], sourceID)
+                self.assertEqual(pathIDs[-1], targetID)
+                self.assertAlmostEqual(pathLength(graph, pathIDs), pathLength(graph, expected), places = 3)
+
+    def testRetargetedGoal(self):
+        self.checkReplans(moveStart = False)
+
+    def testRetargetedGoalAndStart(self):
+        self.checkReplans(moveStart = True)
+
+
+if __name__ == "__main__":
+    unittest.main()
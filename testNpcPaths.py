@@ -0,0 +1,86 @@
+"""
+Checks how NPCs hold on to path requests that are still pending. Needs Panda3D,
+but opens no window. Run it with:
+
+    python -m unittest testNpcPaths
+"""
+from direct.showbase.ShowBase import ShowBase
+from pandac.PandaModules import NodePath
+import unittest
+
+# npc and pathFinder need render and friends at import time
+try:
+    base
+except NameError:
+    ShowBase(windowType = "none")
+
+from npc import NPC
+from pathFinder import PathFinder
+
+class PathFollower(NodePath):
+    """Just the path following parts of an NPC, without its model and sensors."""
+
+    setBestPath = NPC.__dict__["setBestPath"]
+    followBestPath = NPC.__dict__["followBestPath"]
+    isPathPending = NPC.__dict__["isPathPending"]
+    receivePath = NPC.__dict__["receivePath"]
+
+    def __init__(self):
+        NodePath.__init__(self, "path follower")
+        self.reparentTo(render)
+        self.pathSmoothening = False
+        self.navMeshPlanning = False
+        self.backgroundPlanning = False
+        self.pathRequest = None
+        self.bestPath = None
+        self.pathIndex = 0
+        self.currentTarget = None
+        self.legStart = None
+
+
+class PendingPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cancelled = []
+        self.cancelPathRequest = PathFinder.__dict__["cancelPathRequest"]
+        PathFinder.cancelPathRequest = staticmethod(self.cancelled.append)
+        self.npc = PathFollower()
+        self.waypoint = render.attachNewNode("waypoint")
+        self.waypoint.setPos(10, 0, 0)
+        self.nextWaypoint = render.attachNewNode("next waypoint")
+        self.nextWaypoint.setPos(20, 0, 0)
+
+    def tearDown(self):
+        PathFinder.cancelPathRequest = self.cancelPathRequest
+        for nodePath in (self.npc, self.waypoint, self.nextWaypoint):
+            nodePath.removeNode()
+
+    def testRequestOutlivesTheEndOfThePath(self):
+        request = object()
+        self.npc.setBestPath((self.waypoint,))
+        self.npc.pathRequest = request
+        #Reach the last waypoint while the request is still out
+        self.npc.setPos(10, 0.5, 0)
+        self.npc.followBestPath()
+        self.assertEqual(self.npc.bestPath, ())
+        self.assertTrue(self.npc.pathRequest is request)
+        self.assertTrue(self.npc.currentTarget is self.waypoint)
+        self.assertEqual(self.cancelled, [])
+
+        self.npc.receivePath(request, (self.nextWaypoint,))
+        self.assertEqual(self.npc.bestPath, (self.nextWaypoint,))
+        self.assertFalse(self.npc.isPathPending())
+        self.assertEqual(self.cancelled, [])
+
+    def testNewPathReplacesPendingRequest(self):
+        request = object()
+        self.npc.pathRequest = request
+        self.npc.setBestPath(())
+        self.assertTrue(self.npc.pathRequest is request)
+        self.npc.setBestPath((self.nextWaypoint,))
+        self.assertFalse(self.npc.isPathPending())
+        self.assertEqual(self.cancelled, [request])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Checks SpatialHash's queries against measuring every point, on random points
+spread over many cells. Run it with:
+
+    python -m unittest testSpatialHash
+"""
+import math
+import random
+import unittest
+from spatialHash import SpatialHash
+
+def bruteForce(points, position, radius = None):
+    """(distance, key) for every point within radius of position, nearest first."""
+    found = []
+    for key, point in points:
+        distance = math.sqrt(sum([(point[i] - position[i]) ** 2 for i in range(3)]))
+        if radius is None or distance <= radius:
+            found.append((distance, key))
+    found.sort()
+    return found
+
+def distances(found):
+    return [distance for distance, key in found]
+
+
+class SpatialHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(5)
+        #Heights too, since the queries measure in 3D
+        self.points = [(i, (self.rng.uniform(-200, 200), self.rng.uniform(-200, 200), self.rng.uniform(-5, 5)))
+                       for i in range(500)]
+        self.grid = SpatialHash(cellSize = 40)
+        self.grid.update(self.points)
+
+    def randomPosition(self):
+        #Some of them outside the points' square
+        return (self.rng.uniform(-300, 300), self.rng.uniform(-300, 300), self.rng.uniform(-5, 5))
+
+    def testQueryRadius(self):
+        for query in range(200):
+            position = self.randomPosition()
+            radius = self.rng.choice([0.5, 5, 39.9, 40, 85, 500])
+            found = self.grid.queryRadius(position, radius)
+            expected = bruteForce(self.points, position, radius)
+            self.assertEqual(sorted([key for distance, key in found]), sorted([key for distance, key in expected]))
+            self.assertEqual(distances(found), distances(expected))
+
+    def testKNearest(self):
+        for query in range(200):
+            position = self.randomPosition()
+            k = self.rng.choice([1, 2, 7, 30, 600])
+            found = self.grid.kNearest(position, k)
+            expected = bruteForce(self.points, position)[:k]
+            self.assertEqual(distances(found), distances(expected))
+            #Points at the same distance could come in either order, so check each key's own distance
+            allDistances = dict([(key, distance) for distance, key in bruteForce(self.points, position)])
+            self.assertEqual(len(set([key for distance, key in found])), len(found))
+            for distance, key in found:
+                self.assertEqual(distance, allDistances[key])
+
+    def testKNearestWithinMaxRadius(self):
+        for query in range(200):
+            position = self.randomPosition()
+            k = self.rng.choice([1, 5, 50])
+            maxRadius = self.rng.choice([3, 40, 100])
+            found = self.grid.kNearest(position, k, maxRadius)
+            expected = bruteForce(self.points, position, maxRadius)[:k]
+            self.assertEqual(distances(found), distances(expected))
+
+    def testEmpty(self):
+        grid = SpatialHash(cellSize = 40)
+        self.assertEqual(grid.queryRadius((0, 0, 0), 100), [])
+        self.assertEqual(grid.kNearest((0, 0, 0), 3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
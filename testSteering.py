@@ -0,0 +1,218 @@
+"""
+Checks SteeringCore against the per NPC seek and wander it stands in for, and
+against its own behaviors stepped one at a time for frames where an NPC asks for
+both a wander and a seek. Needs numpy. Run it with:
+
+    python -m unittest testSteering
+"""
+import math
+import random
+import unittest
+import steering
+from steering import SteeringCore
+
+def makeCore(rng, count):
+    return SteeringCore([rng.uniform(5, 30) for i in range(count)], [rng.uniform(50, 300) for i in range(count)],
+                        [1.0] * count, [(rng.uniform(-2.5, 2.5), rng.uniform(-2.5, 2.5)) for i in range(count)],
+                        [rng.randrange(steering.wanderInterval) for i in range(count)])
+
+def request(core, kind, index, target):
+    if kind == "wander":
+        core.wander(index)
+    else:
+        core.seek(index, target[0], target[1])
+
+def float32(value):
+    return steering.numpy.float32(value)
+
+
+class PerNPCSteering():
+    """
+    NPC.seek, NPC.wander and the Agent moves they make, line for line, on a plain
+    position and heading instead of a NodePath. The wander target is kept in 32 bit
+    floats, as the Vec2 is. Each call returns 1 if it moved and 0 if it stopped.
+    """
+
+    def __init__(self, x, y, h, speed, turnRate, scale, wanderTarget, callCount, randomStream):
+        self.x, self.y, self.h = x, y, h
+        self.speed, self.turnRate, self.scale = speed, turnRate, scale
+        self.wanderTarget = [float32(wanderTarget[0]), float32(wanderTarget[1])]
+        self.callCount = callCount
+        self.random = randomStream
+        self.elapsedTime = 0.0
+
+    def RandomClamped(self):
+        r = self.random.uniform(-1000, 1000)
+        r /= 1000
+        return r
+
+    def turnLeft(self, angle):
+        self.h += angle
+
+    def turnRight(self, angle):
+        self.h -= angle
+
+    def moveForward(self, distance):
+        #setFluidY(self, -distance)
+        radians = math.radians(self.h)
+        self.x += distance * self.scale * math.sin(radians)
+        self.y -= distance * self.scale * math.cos(radians)
+
+    def wander(self):
+        self.callCount += 1
+        wanderCircleRadius = 2.5
+        if self.callCount == 5:
+            jitter = 50.
+            #wanderTarget += Vec2(...), then normalize() and *= wanderCircleRadius
+            x = self.wanderTarget[0] + float32(self.RandomClamped() * jitter)
+            y = self.wanderTarget[1] + float32(self.RandomClamped() * jitter)
+            lengthSquared = x * x + y * y
+            if lengthSquared != 0:
+                length = steering.numpy.sqrt(lengthSquared)
+                x, y = x / length, y / length
+            self.wanderTarget = [x * float32(wanderCircleRadius), y * float32(wanderCircleRadius)]
+            self.callCount = 0
+        wanderDistance = 5.0
+        theta = math.atan2(float(self.wanderTarget[1]), float(self.wanderTarget[0]))
+        relativeX = (wanderCircleRadius * math.cos(theta))
+        relativeY = (wanderCircleRadius * math.sin(theta)) - wanderDistance
+        distance = self.speed * self.elapsedTime
+        turnAngle = self.turnRate * self.elapsedTime
+        degreesHeading = math.degrees(math.atan2(relativeY, relativeX))
+        if -90.0 < degreesHeading and degreesHeading <= 0.0:
+            self.turnLeft(turnAngle)
+        else:
+            self.turnRight(turnAngle)
+        self.moveForward(distance)
+        return 1
+
+    def seek(self, targetX, targetY):
+        worldHeading = self.h % 360
+        worldYDirection = targetY - self.y
+        worldXDirection = targetX - self.x
+        worldDirectionToTarget = math.degrees(math.atan2(worldYDirection, worldXDirection))
+        distanceToTarget = math.hypot(worldYDirection, worldXDirection)
+        angleToTarget = (worldDirectionToTarget - worldHeading + 180) % 360
+        turnAngle = self.turnRate * self.elapsedTime
+        distance = self.speed * self.elapsedTime
+        if not 0 < distanceToTarget:
+            return 0
+        if 45 <= angleToTarget <= 135:
+            self.moveForward(distance)
+        if 0 <= angleToTarget < 90:
+            self.turnRight(turnAngle)
+        elif 90 <= angleToTarget < 270:
+            self.turnLeft(turnAngle)
+        elif 270 <= angleToTarget < 360:
+            self.turnRight(turnAngle)
+        return 1
+
+
+@unittest.skipIf(steering.numpy is None, "needs numpy")
+class MatchesPerNPCTest(unittest.TestCase):
+
+    def testRandomFrames(self):
+        rng = random.Random(11)
+        count = 40
+        speeds = [rng.uniform(5, 30) for i in range(count)]
+        turnRates = [rng.uniform(50, 300) for i in range(count)]
+        scales = [rng.choice([1.0, 0.5, 2.0]) for i in range(count)]
+        wanderTargets = [(rng.uniform(-2.5, 2.5), rng.uniform(-2.5, 2.5)) for i in range(count)]
+        callCounts = [rng.randrange(steering.wanderInterval) for i in range(count)]
+        positions = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(count)]
+        headings = [rng.uniform(-360, 360) for i in range(count)]
+
+        core = SteeringCore(speeds, turnRates, scales, wanderTargets, callCounts)
+        #Each NPC's own random stream, and the same stream for the core's jitters
+        coreStreams = [random.Random(100 + i) for i in range(count)]
+        perNPC = [PerNPCSteering(positions[i][0], positions[i][1], headings[i], speeds[i], turnRates[i], scales[i],
+                                 wanderTargets[i], callCounts[i], random.Random(100 + i)) for i in range(count)]
+
+        kinds = [(), ("seek",), ("wander",), ("wander", "seek"), ("seek", "wander")]
+        for frame in range(60):
+            elapsedTimes = [rng.uniform(0.01, 0.05) for i in range(count)]
+            expectedMoving = []
+            for i in range(count):
+                npc = perNPC[i]
+                npc.elapsedTime = elapsedTimes[i]
+                #Now and then a target right where the NPC is, which stops it
+                if rng.random() < 0.1:
+                    target = (positions[i][0], positions[i][1])
+                else:
+                    target = (rng.uniform(-50, 50), rng.uniform(-50, 50))
+                moving = []
+                for kind in rng.choice(kinds):
+                    if kind == "wander":
+                        core.wander(i)
+                        moving.append(npc.wander())
+                    else:
+                        core.seek(i, target[0], target[1])
+                        moving.append(npc.seek(target[0], target[1]))
+                expectedMoving.append(moving + [-1] * (2 - len(moving)))
+
+            #NPC.drawJitters
+            jitters = []
+            for i in core.getJitterDue():
+                stream = coreStreams[i]
+                jitters.append((stream.uniform(-1000, 1000) / 1000 * steering.wanderJitter,
+                                stream.uniform(-1000, 1000) / 1000 * steering.wanderJitter))
+            stepped, steppedHeadings, moving = core.step(positions, headings, elapsedTimes, jitters)
+            positions, headings = stepped.tolist(), steppedHeadings.tolist()
+
+            self.assertEqual(moving.tolist(), expectedMoving)
+            for i in range(count):
+                npc = perNPC[i]
+                self.assertAlmostEqual(positions[i][0], npc.x, places = 9)
+                self.assertAlmostEqual(positions[i][1], npc.y, places = 9)
+                self.assertAlmostEqual(headings[i], npc.h, places = 9)
+                self.assertEqual(core.getWanderState(i), (float(npc.wanderTarget[0]), float(npc.wanderTarget[1]), npc.callCount))
+
+
+@unittest.skipIf(steering.numpy is None, "needs numpy")
+class BothRequestsTest(unittest.TestCase):
+
+    def checkOrder(self, order):
+        rng = random.Random(3)
+        count = 20
+        together = makeCore(rng, count)
+        rng = random.Random(3)
+        apart = makeCore(rng, count)
+        positions = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(count)]
+        headings = [rng.uniform(-360, 360) for i in range(count)]
+        targets = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(count)]
+        jitters = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(count)]
+
+        for i in range(count):
+            for kind in order:
+                request(together, kind, i, targets[i])
+        due = together.getJitterDue()
+        togetherPositions, togetherHeadings, togetherMoving = together.step(
+            positions, headings, 0.05, [jitters[i] for i in due])
+
+        apartPositions, apartHeadings = positions, headings
+        apartMoving = []
+        for kind in order:
+            for i in range(count):
+                request(apart, kind, i, targets[i])
+            due = apart.getJitterDue()
+            apartPositions, apartHeadings, moving = apart.step(apartPositions, apartHeadings, 0.05,
+                                                               [jitters[i] for i in due])
+            apartMoving.append(moving[:, 0])
+
+        self.assertEqual(togetherPositions.tolist(), apartPositions.tolist())
+        self.assertEqual(togetherHeadings.tolist(), apartHeadings.tolist())
+        self.assertEqual(together.wanderTargets.tolist(), apart.wanderTargets.tolist())
+        self.assertEqual(together.callCounts.tolist(), apart.callCounts.tolist())
+        self.assertEqual(togetherMoving[:, 0].tolist(), apartMoving[0].tolist())
+        self.assertEqual(togetherMoving[:, 1].tolist(), apartMoving[1].tolist())
+
+    def testWanderThenSeek(self):
+        #The frame act turns a wander into a seek
+        self.checkOrder(("wander", "seek"))
+
+    def testSeekThenWander(self):
+        self.checkOrder(("seek", "wander"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Checks that the path finder's line of sight rays only stop at registered walls.
+Needs Panda3D, but opens no window. Run it with:
+
+    python -m unittest testWallRays
+"""
+from direct.showbase.ShowBase import ShowBase
+from pandac.PandaModules import CollisionNode
+from pandac.PandaModules import CollisionPolygon
+from pandac.PandaModules import CollisionSphere
+from pandac.PandaModules import NodePath
+from pandac.PandaModules import Point3
+import unittest
+
+# pathFinder needs render and friends at import time
+try:
+    base
+except NameError:
+    ShowBase(windowType = "none")
+
+import pathFinder
+from pathFinder import PathFinder, rayHeight
+
+class Spot(NodePath):
+    """A waypoint as far as checkWallMap cares: somewhere in render with an ID."""
+
+    def __init__(self, x, y, ID):
+        NodePath.__init__(self, "spot " + str(ID))
+        self.reparentTo(render)
+        self.setPos(x, y, 0.5)
+        self.ID = ID
+
+
+class WallRayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.thing = render.attachNewNode("thing")
+        self.waypoint = render.attachNewNode("waypoint")
+        self.waypoint.setPos(10, 0, 0)
+        self.nodePaths = [self.thing, self.waypoint]
+
+    def tearDown(self):
+        for nodePath in self.nodePaths:
+            if nodePath in pathFinder.wallNPs:
+                pathFinder.wallNPs.remove(nodePath)
+            nodePath.removeNode()
+
+    def addSphere(self, parent, x):
+        """An agent's collision sphere, with the default masks."""
+        sphereNP = parent.attachNewNode(CollisionNode("agent sphere"))
+        sphereNP.node().addSolid(CollisionSphere(0, 0, rayHeight, 2))
+        sphereNP.setX(render, x)
+        self.nodePaths.append(sphereNP)
+
+    def testAgentSpheresDontBlock(self):
+        #One on the caster and one halfway there
+        self.addSphere(self.thing, 0)
+        self.addSphere(render, 5)
+        self.assertTrue(PathFinder.rayIsClear(self.thing, self.waypoint))
+        self.assertEqual(PathFinder.raysAreClear([(self.thing, self.waypoint)]), [True])
+
+    def addWall(self):
+        wallNP = render.attachNewNode(CollisionNode("wall"))
+        #Both faces, since a polygon only collides from the front
+        corners = [Point3(5, -10, 0), Point3(5, -10, 10), Point3(5, 10, 10), Point3(5, 10, 0)]
+        wallNP.node().addSolid(CollisionPolygon(*corners))
+        corners.reverse()
+        wallNP.node().addSolid(CollisionPolygon(*corners))
+        self.nodePaths.append(wallNP)
+        PathFinder.registerWalls(wallNP)
+
+    def testWallsBlock(self):
+        self.addWall()
+        self.assertFalse(PathFinder.rayIsClear(self.thing, self.waypoint))
+        self.assertEqual(PathFinder.raysAreClear([(self.thing, self.waypoint)]), [False])
+
+    def testBatchedHitsFindTheirPairs(self):
+        self.addWall()
+        aside = Spot(0, 20, 0)
+        beyond = Spot(10, 5, 1)
+        farSide = Spot(15, 0, 2)
+        self.nodePaths.extend([aside, beyond, farSide])
+        #Blocked and clear pairs mixed up, one of them twice, through a real traversal
+        pairs = [(self.thing, aside), (self.thing, self.waypoint), (beyond, farSide),
+                 (self.thing, beyond), (aside, self.thing), (self.thing, self.waypoint)]
+        self.assertEqual(PathFinder.raysAreClear(pairs), [True, False, True, False, True, False])
+        self.assertEqual(PathFinder.raysAreClear(pairs), [True, False, True, False, True, False])
+        self.assertEqual([PathFinder.rayIsClear(thing, waypoint) for thing, waypoint in pairs],
+                         [True, False, True, False, True, False])
+
+    def testWallMapAgreesWithRays(self):
+        self.addWall()
+        PathFinder.loadWalls()
+        spots = [Spot(0, 0, 0), Spot(10, 0, 1), Spot(0, 26, 2), Spot(10, 22, 3), Spot(10, -5, 4), Spot(8, 15, 5)]
+        self.nodePaths.extend(spots)
+        #Some of the pairs have the wall between them, and none of them graze its ends
+        self.assertFalse(pathFinder.wallMap.isClear(PathFinder.position(spots[0]), PathFinder.position(spots[1])))
+        self.assertEqual(PathFinder.checkWallMap(spots), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
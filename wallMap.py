@@ -0,0 +1,123 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def sliceConvexPolygon(points, height):
+    """
+    Returns the 2D segment (x1, y1, x2, y2) where the plane z = height cuts the
+    convex polygon given by its (x, y, z) corners, or None if it doesn't.
+    """
+    crossings = []
+    for i in range(len(points)):
+        x1, y1, z1 = points[i]
+        x2, y2, z2 = points[(i + 1) % len(points)]
+        if z1 == height:
+            crossings.append((x1, y1))
+        if (z1 - height) * (z2 - height) < 0:
+            t = (height - z1) / (z2 - z1)
+            crossings.append((x1 + t * (x2 - x1), y1 + t * (y2 - y1)))
+    if len(crossings) < 2:
+        return None
+    (x1, y1), (x2, y2) = crossings[0], crossings[-1]
+    return (x1, y1, x2, y2)
+
+def orientation(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+def segmentsIntersect(ax, ay, bx, by, cx, cy, dx, dy):
+    """True if segment ab touches segment cd."""
+    d1 = orientation(cx, cy, dx, dy, ax, ay)
+    d2 = orientation(cx, cy, dx, dy, bx, by)
+    d3 = orientation(ax, ay, bx, by, cx, cy)
+    d4 = orientation(ax, ay, bx, by, dx, dy)
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
+        return True
+    #Collinear or touching cases
+    def onSegment(px, py, qx, qy, rx, ry):
+        return min(px, qx) <= rx <= max(px, qx) and min(py, qy) <= ry <= max(py, qy)
+    if d1 == 0 and onSegment(cx, cy, dx, dy, ax, ay):
+        return True
+    if d2 == 0 and onSegment(cx, cy, dx, dy, bx, by):
+        return True
+    if d3 == 0 and onSegment(ax, ay, bx, by, cx, cy):
+        return True
+    if d4 == 0 and onSegment(ax, ay, bx, by, dx, dy):
+        return True
+    return False
+
+
+class WallMap():
+    """
+    The walls of the level as flat 2D segments, cut at the height the path
+    finder's rays are cast at. Line of sight checks against it don't need the
+    collision system or the scene graph, so it is safe to use from other threads.
+
+    With numpy the segments are also kept as arrays, and areClear tests many lines
+    against all of them at once. Without it we fall back to testing them one at a
+    time, with the same answers. A single isClear is quicker without numpy's
+    overhead, so it always tests them one at a time.
+    """
+
+    # Most line pairs to test in one numpy pass, to bound the size of the temporaries
+    batchSize = 65536
+
+    def __init__(self, segments):
+        self.segments = tuple(segments)
+        if numpy is not None:
+            walls = numpy.array(self.segments, dtype = numpy.float64).reshape(-1, 4)
+            self.cx, self.cy, self.dx, self.dy = walls[:, 0], walls[:, 1], walls[:, 2], walls[:, 3]
+            self.minX = numpy.minimum(self.cx, self.dx)
+            self.maxX = numpy.maximum(self.cx, self.dx)
+            self.minY = numpy.minimum(self.cy, self.dy)
+            self.maxY = numpy.maximum(self.cy, self.dy)
+
+    def isClear(self, start, end):
+        """True if nothing blocks the straight line from start to end, both (x, y)."""
+        ax, ay = start
+        bx, by = end
+        minX, maxX = min(ax, bx), max(ax, bx)
+        minY, maxY = min(ay, by), max(ay, by)
+        for cx, cy, dx, dy in self.segments:
+            if max(cx, dx) < minX or min(cx, dx) > maxX or max(cy, dy) < minY or min(cy, dy) > maxY:
+                continue
+            if segmentsIntersect(ax, ay, bx, by, cx, cy, dx, dy):
+                return False
+        return True
+
+    def areClear(self, starts, ends):
+        """Batched isClear. Returns a list with one answer per (starts[i], ends[i]) line."""
+        if numpy is None:
+            return [self.isClear(starts[i], ends[i]) for i in range(len(starts))]
+        if not self.segments:
+            return [True] * len(starts)
+        clear = []
+        #Each pass tests lines against every wall, so keep lines * walls near batchSize
+        linesPerPass = max(self.batchSize // len(self.segments), 1)
+        for first in range(0, len(starts), linesPerPass):
+            lineStarts = numpy.array(starts[first:first + linesPerPass], dtype = numpy.float64).reshape(-1, 2)
+            lineEnds = numpy.array(ends[first:first + linesPerPass], dtype = numpy.float64).reshape(-1, 2)
+            clear.extend(self.linesAreClear(lineStarts, lineEnds).tolist())
+        return clear
+
+    def linesAreClear(self, starts, ends):
+        """
+        Does the work of segmentsIntersect for every line against every wall, with
+        the lines as rows and the walls as columns. starts and ends are (n, 2) arrays.
+        """
+        ax, ay = starts[:, 0:1], starts[:, 1:2]
+        bx, by = ends[:, 0:1], ends[:, 1:2]
+        cx, cy, dx, dy = self.cx, self.cy, self.dx, self.dy
+        d1 = (dx - cx) * (ay - cy) - (dy - cy) * (ax - cx)
+        d2 = (dx - cx) * (by - cy) - (dy - cy) * (bx - cx)
+        d3 = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        d4 = (bx - ax) * (dy - ay) - (by - ay) * (dx - ax)
+        blocked = (((d1 > 0) & (d2 < 0)) | ((d1 < 0) & (d2 > 0))) & (((d3 > 0) & (d4 < 0)) | ((d3 < 0) & (d4 > 0)))
+        #Collinear or touching cases
+        lineMinX, lineMaxX = numpy.minimum(ax, bx), numpy.maximum(ax, bx)
+        lineMinY, lineMaxY = numpy.minimum(ay, by), numpy.maximum(ay, by)
+        blocked |= (d1 == 0) & (self.minX <= ax) & (ax <= self.maxX) & (self.minY <= ay) & (ay <= self.maxY)
+        blocked |= (d2 == 0) & (self.minX <= bx) & (bx <= self.maxX) & (self.minY <= by) & (by <= self.maxY)
+        blocked |= (d3 == 0) & (lineMinX <= cx) & (cx <= lineMaxX) & (lineMinY <= cy) & (cy <= lineMaxY)
+        blocked |= (d4 == 0) & (lineMinX <= dx) & (dx <= lineMaxX) & (lineMinY <= dy) & (dy <= lineMaxY)
+        return ~blocked.any(axis = 1)
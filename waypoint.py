@@ -13,6 +13,7 @@ class Waypoint(NodePath):
         self.neighbors = []
         self.ID = ID
         self.previousWaypoint = None
+        self.graph = None
         torusModel = "models/Torus/Torus.egg"
         self.torus = loader.loadModel(torusModel)
 
@@ -33,9 +34,13 @@ class Waypoint(NodePath):
         
     def setNeighbors(self, neighbors):
         self.neighbors = neighbors
+        if self.graph is not None:
+            self.graph.invalidate()
         
     def addNeighbor(self, neighbor):
         self.neighbors.append(neighbor)
+        if self.graph is not None:
+            self.graph.invalidate()
         
     def getNeighbors(self):
         return self.neighbors
@@ -0,0 +1,147 @@
+"""
+Builds each room's waypoint graph from its model instead of by hand.
+
+Points are sampled on a grid across the floor, wherever an agent fits between
+the walls. Every pair of points that can see each other is linked, and then
+links that are barely shorter than going through a third point are pruned.
+The graph is cached in rooms/roomN.graph next to rooms/roomN.egg, keyed by a
+hash of the egg file, so it is only built again when the model changes.
+
+Run this file to rebuild the caches by hand:
+
+    python waypointBuilder.py rooms/room1.egg rooms/room2.egg rooms/room3.egg
+"""
+from array import array
+import hashlib
+import math
+import os
+import struct
+import sys
+from compactGraph import CompactGraph
+from navMesh import readEggPolygons, getWallFootprints, isWalkable
+from wallMap import WallMap, sliceConvexPolygon
+
+# Bump this whenever the file layout or the way graphs are built changes
+graphFileVersion = 1
+graphFileMagic = b"KWGRAPH"
+headerFormat = "<7sH20sii"
+
+def hashFile(fileName):
+    eggFile = open(fileName, "rb")
+    digest = hashlib.sha1(eggFile.read()).digest()
+    eggFile.close()
+    return digest
+
+def buildWaypointGraph(wallPolygons, floor = (-9.0, -9.0, 9.0, 9.0), spacing = 2.5, clearance = 0.3,
+                       wallHeight = 1.0, pruneTolerance = 1.05):
+    """
+    Returns a CompactGraph of walkable points on the floor rectangle (minX, minY,
+    maxX, maxY), in the model's coordinates. A link is pruned when going through a
+    point linked to both of its ends is at most pruneTolerance times as long.
+    """
+    footprints = getWallFootprints(wallPolygons)
+    wallMap = WallMap([segment for segment in [sliceConvexPolygon(polygon, wallHeight) for polygon in wallPolygons]
+                       if segment is not None])
+    minX, minY, maxX, maxY = floor
+    columns = int((maxX - minX) / spacing)
+    rows = int((maxY - minY) / spacing)
+    #Center the grid on the floor
+    offsetX = minX + (maxX - minX - (columns - 1) * spacing) / 2.0
+    offsetY = minY + (maxY - minY - (rows - 1) * spacing) / 2.0
+    positions = []
+    for row in range(rows):
+        for column in range(columns):
+            x, y = offsetX + column * spacing, offsetY + row * spacing
+            if isWalkable(x, y, footprints, clearance):
+                positions.append((x, y))
+
+    def distance(a, b):
+        return math.hypot(positions[b][0] - positions[a][0], positions[b][1] - positions[a][1])
+
+    linked = [set() for position in positions]
+    for a in range(len(positions)):
+        for b in range(a + 1, len(positions)):
+            if wallMap.isClear(positions[a], positions[b]):
+                linked[a].add(b)
+                linked[b].add(a)
+
+    #Longest links first, so the short links that replace them are still there
+    links = [(distance(a, b), a, b) for a in range(len(positions)) for b in linked[a] if a < b]
+    links.sort(reverse = True)
+    for length, a, b in links:
+        for c in linked[a] & linked[b]:
+            if distance(a, c) + distance(c, b) <= length * pruneTolerance:
+                linked[a].discard(b)
+                linked[b].discard(a)
+                break
+
+    return CompactGraph(positions, [sorted(neighbors) for neighbors in linked])
+
+def writeGraph(fileName, graph, eggHash):
+    """
+    Writes the graph's arrays after a header holding the file version, the hash of
+    the egg it was built from and the node and edge counts. Little endian throughout.
+    """
+    graphFile = open(fileName, "wb")
+    graphFile.write(struct.pack(headerFormat, graphFileMagic, graphFileVersion, eggHash,
+                                graph.nodeCount, graph.getEdgeCount()))
+    for values in (graph.positions, graph.offsets, graph.neighborIDs, graph.lengths):
+        values = array(values.typecode, values)
+        if sys.byteorder != "little":
+            values.byteswap()
+        values.tofile(graphFile)
+    graphFile.close()
+
+def readGraph(fileName, eggHash):
+    """
+    Returns the CompactGraph in a file written by writeGraph, or None if there is no
+    such file, it's from another version, or it was built from a different egg.
+    """
+    if not os.path.exists(fileName):
+        return None
+    graphFile = open(fileName, "rb")
+    try:
+        header = graphFile.read(struct.calcsize(headerFormat))
+        if len(header) != struct.calcsize(headerFormat):
+            return None
+        magic, version, fileHash, nodeCount, edgeCount = struct.unpack(headerFormat, header)
+        if magic != graphFileMagic or version != graphFileVersion or fileHash != eggHash:
+            return None
+        graph = CompactGraph([], [])
+        graph.nodeCount = nodeCount
+        try:
+            for name, typecode, count in (("positions", 'f', 2 * nodeCount), ("offsets", 'i', nodeCount + 1),
+                                          ("neighborIDs", 'i', edgeCount), ("lengths", 'f', edgeCount)):
+                values = array(typecode)
+                values.fromfile(graphFile, count)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                setattr(graph, name, values)
+        except EOFError:
+            return None
+        return graph
+    finally:
+        graphFile.close()
+
+def loadRoomGraph(eggFileName):
+    """
+    Returns the room's CompactGraph from its cache, building and caching it first
+    if the cache is missing or out of date.
+    """
+    graphFileName = eggFileName.rsplit(".", 1)[0] + ".graph"
+    eggHash = hashFile(eggFileName)
+    graph = readGraph(graphFileName, eggHash)
+    if graph is None:
+        print("Building the waypoint graph for " + eggFileName)
+        graph = buildWaypointGraph(readEggPolygons(eggFileName))
+        writeGraph(graphFileName, graph, eggHash)
+    return graph
+
+
+if __name__ == "__main__":
+    for eggFileName in sys.argv[1:]:
+        graph = buildWaypointGraph(readEggPolygons(eggFileName))
+        graphFileName = eggFileName.rsplit(".", 1)[0] + ".graph"
+        writeGraph(graphFileName, graph, hashFile(eggFileName))
+        print("Wrote " + str(graph.nodeCount) + " waypoints and " + str(graph.getEdgeCount()) +
+              " links to " + graphFileName)
@@ -0,0 +1,282 @@
+import heapq
+import math
+from collections import deque
+from compactGraph import CompactGraph
+from spatialHash import ringCells
+
+class WaypointGraph():
+    """
+    Precomputed shortest path data for one room's waypoints.
+
+    The graph is built once at level load. It runs a Dijkstra search from
+    every waypoint and keeps the distance and the first hop toward every
+    other waypoint, so a path between two waypoints is a walk through the
+    nextHop table instead of a search.
+
+    Waypoints call invalidate() when their neighbors change, and the tables
+    are rebuilt the next time they are used.
+
+    The waypoints are also bucketed into a uniform grid over XY so the closest
+    reachable waypoint can be found without testing every waypoint.
+    """
+
+    def __init__(self, waypoints, distance, position, pathCacheSize = 256):
+        self.waypoints = waypoints
+        self.distance = distance
+        self.position = position
+        self.pathCache = PathCache(pathCacheSize)
+        self.version = 0
+        self.isValid = False
+        #Set by buildVisibility once the room's walls are in place
+        self.hasVisibility = False
+        for waypoint in waypoints:
+            waypoint.graph = self
+        self.build()
+
+    def invalidate(self):
+        self.isValid = False
+        self.version += 1
+
+    def build(self):
+        infinity = 1E400
+        #Everything below works on the compact copy, so searches never touch the waypoints' NodePaths
+        self.compact = compact = CompactGraph.fromWaypoints(self.waypoints, self.position, self.distance)
+        nodeCount = compact.nodeCount
+        self.waypointsByID = [None] * nodeCount
+        for waypoint in self.waypoints:
+            self.waypointsByID[waypoint.ID] = waypoint
+
+        offsets = compact.offsets
+        neighborIDs = compact.neighborIDs
+        lengths = compact.lengths
+        self.dist = []
+        self.nextHop = []
+        for sourceID in range(nodeCount):
+            dist = [infinity] * nodeCount
+            firstHop = [-1] * nodeCount
+            dist[sourceID] = 0
+            firstHop[sourceID] = sourceID
+            openSet = [(0, sourceID)]
+            while openSet:
+                currentDist, currentID = heapq.heappop(openSet)
+                if currentDist > dist[currentID]:
+                    continue
+                for edge in range(offsets[currentID], offsets[currentID + 1]):
+                    neighborID = neighborIDs[edge]
+                    neighborDist = currentDist + lengths[edge]
+                    if neighborDist < dist[neighborID]:
+                        dist[neighborID] = neighborDist
+                        if currentID == sourceID:
+                            firstHop[neighborID] = neighborID
+                        else:
+                            firstHop[neighborID] = firstHop[currentID]
+                        heapq.heappush(openSet, (neighborDist, neighborID))
+            self.dist.append(dist)
+            self.nextHop.append(firstHop)
+        self.buildGrid()
+        self.isValid = True
+
+    def buildGrid(self):
+        positions = [self.compact.getPosition(waypoint.ID) for waypoint in self.waypoints]
+        xs = [x for x, y in positions]
+        ys = [y for x, y in positions]
+        self.gridMinX = min(xs)
+        self.gridMinY = min(ys)
+        #Aim for a couple of waypoints per cell
+        area = max(max(xs) - self.gridMinX, 1.0) * max(max(ys) - self.gridMinY, 1.0)
+        self.cellSize = max(math.sqrt(2.0 * area / len(self.waypoints)), 1.0)
+        self.gridWidth = int((max(xs) - self.gridMinX) / self.cellSize) + 1
+        self.gridHeight = int((max(ys) - self.gridMinY) / self.cellSize) + 1
+        self.grid = {}
+        for index in range(len(self.waypoints)):
+            x, y = positions[index]
+            self.grid.setdefault(self.cellOf(x, y), []).append(index)
+
+    def cellOf(self, x, y):
+        return (int(math.floor((x - self.gridMinX) / self.cellSize)),
+                int(math.floor((y - self.gridMinY) / self.cellSize)))
+
+    def getClosestReachable(self, thing, isReachable, areReachable = None):
+        """
+        Returns the closest waypoint to thing for which isReachable(thing, waypoint)
+        is true, or None. Waypoints are tested nearest first, so we stop at the
+        first one that passes. Ties go to the waypoint that comes first in the list,
+        the same as a linear scan would. If areReachable(thing, waypoints) is given,
+        the waypoints settled by each ring are tested with it in one batch instead.
+        """
+        if not self.isValid:
+            self.build()
+        x, y = self.position(thing)
+        centerX, centerY = self.cellOf(x, y)
+        #Rings beyond this can't hold any waypoints
+        maxRing = max(abs(centerX), abs(centerX - self.gridWidth + 1),
+                      abs(centerY), abs(centerY - self.gridHeight + 1))
+        candidates = []
+        for ring in range(maxRing + 1):
+            for cell in ringCells(centerX, centerY, ring):
+                for index in self.grid.get(cell, ()):
+                    heapq.heappush(candidates, (self.compact.distanceTo(self.waypoints[index].ID, x, y), index))
+            #Anything in a cell past this ring is at least this far away
+            searchedRadius = ring * self.cellSize
+            settled = []
+            while candidates and (candidates[0][0] <= searchedRadius or ring == maxRing):
+                distance, index = heapq.heappop(candidates)
+                settled.append(self.waypoints[index])
+            closest = firstReachable(thing, settled, isReachable, areReachable)
+            if closest is not None:
+                return closest
+        return None
+
+    def pathBetween(self, source, target):
+        """
+        Returns the list of waypoints from source to target, both included,
+        or None if target can't be reached from source.
+        """
+        if not self.isValid:
+            self.build()
+        targetID = target.ID
+        currentID = source.ID
+        if self.nextHop[currentID][targetID] == -1:
+            return None
+        path = [self.waypointsByID[currentID]]
+        while currentID != targetID:
+            currentID = self.nextHop[currentID][targetID]
+            path.append(self.waypointsByID[currentID])
+        return path
+
+    def getCachedPath(self, source, target):
+        """
+        Same as pathBetween, but returns an immutable tuple that is shared by every
+        agent asking for the same pair of waypoints.
+        """
+        key = (source.ID, target.ID, self.version)
+        path = self.pathCache.get(key)
+        if path is None:
+            path = tuple(self.pathBetween(source, target) or ())
+            self.pathCache.put(key, path)
+        #Unreachable pairs are cached as empty tuples
+        return path or None
+
+    def buildVisibility(self, isReachable):
+        """
+        Casts a ray between every pair of waypoints once and keeps the answers
+        as one bitmap per waypoint. The room geometry must already be in place.
+        """
+        nodeCount = len(self.waypointsByID)
+        self.visible = [0] * nodeCount
+        for waypoint in self.waypoints:
+            bits = 0
+            for other in self.waypoints:
+                if other is waypoint or isReachable(waypoint, other):
+                    bits |= 1 << other.ID
+            self.visible[waypoint.ID] = bits
+        self.hasVisibility = True
+
+    def isVisible(self, source, target):
+        return (self.visible[source.ID] >> target.ID) & 1 == 1
+
+
+def firstReachable(thing, waypoints, isReachable, areReachable = None):
+    """
+    Returns the first of waypoints that thing can reach, or None. With areReachable
+    they are all tested in one batch, otherwise one at a time until one passes.
+    """
+    if areReachable is None:
+        for waypoint in waypoints:
+            if isReachable(thing, waypoint):
+                return waypoint
+        return None
+    if not waypoints:
+        return None
+    reachable = areReachable(thing, waypoints)
+    for i in range(len(waypoints)):
+        if reachable[i]:
+            return waypoints[i]
+    return None
+
+
+class PathCache():
+    """
+    A bounded least recently used cache of paths, with hit and miss counters so we
+    can see how much path finding it saves.
+
+    Each use of a key stamps it with a counter and queues (stamp, key). The queue
+    keeps stale entries for keys used again since, and eviction skips over them to
+    the first entry whose stamp is still current.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.paths = {}
+        # key:stamp of its last use
+        self.stamps = {}
+        self.recency = deque()
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.paths:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touch(key)
+        return self.paths[key]
+
+    def put(self, key, path):
+        if key not in self.paths and len(self.paths) >= self.capacity:
+            self.evict()
+        self.paths[key] = path
+        self.touch(key)
+
+    def touch(self, key):
+        self.clock += 1
+        self.stamps[key] = self.clock
+        self.recency.append((self.clock, key))
+        #Hits only ever add to the queue, so drop the stale entries now and then
+        if len(self.recency) > 4 * max(self.capacity, 1):
+            entries = [(stamp, key) for key, stamp in self.stamps.items()]
+            entries.sort()
+            self.recency = deque(entries)
+
+    def evict(self):
+        while self.recency:
+            stamp, key = self.recency.popleft()
+            if self.stamps.get(key) == stamp:
+                del self.paths[key]
+                del self.stamps[key]
+                return
+
+    def getStats(self):
+        return {"hits":self.hits, "misses":self.misses, "size":len(self.paths)}
+
+
+class NearestWaypointTracker():
+    """
+    Remembers the last closest waypoint found for one agent. Agents only move a
+    little each frame, so the next answer is almost always that waypoint or one
+    of its neighbors. We only search the whole graph again when none of those
+    are reachable within the hysteresis distance.
+    """
+
+    def __init__(self, hysteresis = 30.0):
+        self.hysteresis = hysteresis
+        self.lastWaypoint = None
+
+    def getClosestReachable(self, graph, thing, isReachable, areReachable = None):
+        lastWaypoint = self.lastWaypoint
+        if lastWaypoint is not None and lastWaypoint.graph is graph:
+            if not graph.isValid:
+                graph.build()
+            x, y = graph.position(thing)
+            ringIDs = [lastWaypoint.ID] + list(graph.compact.getNeighborIDs(lastWaypoint.ID))
+            ring = [graph.waypointsByID[nodeID] for nodeID in ringIDs]
+            candidates = [(graph.compact.distanceTo(ringIDs[i], x, y), i) for i in range(len(ring))]
+            candidates.sort()
+            nearby = [ring[i] for distance, i in candidates if distance <= self.hysteresis]
+            closest = firstReachable(thing, nearby, isReachable, areReachable)
+            if closest is not None:
+                self.lastWaypoint = closest
+                return closest
+        self.lastWaypoint = graph.getClosestReachable(thing, isReachable, areReachable)
+        return self.lastWaypoint
@@ -25,7 +25,8 @@ from pandac.PandaModules import Texture
 from pandac.PandaModules import TextureStage
 from pandac.PandaModules import TransparencyAttrib
 from pandac.PandaModules import Vec3
-from npc import NPC
+from npc import NPC, RandomStreams
+from aiScheduler import AIScheduler
 from player import Player
 import sys
 from direct.task import Task
@@ -33,6 +34,7 @@ from direct.gui.OnscreenText import OnscreenText
 ##from neural_network import NeuralNetwork
 from waypoint import Waypoint
 from pathFinder import PathFinder
+from spatialHash import SpatialHash
 from tasktimer import taskTimer
 from direct.gui.DirectEntry import DirectEntry
 import random
@@ -42,8 +44,23 @@ class World(DirectObject):
         DirectObject.__init__(self)
         
         self.pathSmoothening = True
+        # Build the waypoints from the room models, or set this to False to use the hand placed ones in rooms/room*.py
+        self.generatedWaypoints = True
         self.showWaypoints = False
         self.showCollisions = False
+        self.showPathStats = False
+        # Check line of sight against the flat wall map instead of with rays. The map is compared
+        # with the rays between every room's waypoints first, and the game won't start if they disagree.
+        self.useWallMap = False
+        # Set this to a number to give the NPCs the same random numbers (and wandering) every run
+        self.randomSeed = None
+        # NPCs in rooms the player isn't in think this many times a second, or not at all
+        # until the player comes in if aiSleepInactive is set. One taking its key home
+        # keeps thinking every frame until it gets there.
+        self.aiInactiveRate = 2.0
+        self.aiSleepInactive = False
+        # Where every agent is in render, updated once a frame for the NPCs' sensors
+        self.sensorGrid = SpatialHash(cellSize = 40)
         
         self.accept("escape", sys.exit)
         
@@ -177,7 +194,7 @@ class World(DirectObject):
         environment = render.attachNewNode(cm.generate())
         environment.lookAt(0, 0, -1)
         environment.setPos(100, -100, 0)
-        environment.setCollideMask(BitMask32.allOn())
+        environment.setCollideMask(BitMask32.allOn() & ~PathFinder.getWallCollideMask())
         environment.reparentTo(render)
         
         texture = loader.loadTexture("textures/ground.png")
@@ -248,19 +265,24 @@ class World(DirectObject):
             
     def __setupLevel(self):
         """
-        Some notes and caveats: Each time you add a room, make sure that you tag it with key "Room" and value "<room number>".
+        Some notes and caveats: Each time you add a room, make sure that you tag it with key "Room" and value "<room number>",
+        and register its walls with PathFinder.registerWalls.
         This is so our A* algorithm can do clear path detection on only the rooms, not anything else.
         """
         level1 = render.attachNewNode("level 1 node path")
         
-        execfile("rooms/room1.py")
-
         self.room1 = loader.loadModel("rooms/room1")
         self.room1.findTexture("*").setMinfilter(Texture.FTLinearMipmapLinear)
         self.room1.setScale(10)
         self.room1.setTexScale(TextureStage.getDefault(), 10)
         self.room1.reparentTo(render)
+        if self.generatedWaypoints:
+            self.room1waypoints = PathFinder.loadRoomWaypoints("rooms/room1.egg", self.room1)
+        else:
+            execfile("rooms/room1.py")
+        PathFinder.loadWaypointGraph(self.room1waypoints)
         self.room1.find("**/Cube*;+h").setTag("Room", "1")
+        PathFinder.registerWalls(self.room1.find("**/Cube*;+h"))
 
         keyNest = loader.loadModel("models/nest")
         keyNest.findTexture("*").setMinfilter(Texture.FTLinearMipmapLinear)
@@ -279,16 +301,19 @@ class World(DirectObject):
         self.room1Key.setTexScale(TextureStage.getDefault(), 0.1)
         
         #self.setWaypoints("room2")
-        self.room2waypoints = None
-        execfile("rooms/room2.py")
-
         self.room2 = loader.loadModel("rooms/room2")
         self.room2.findTexture("*").setMinfilter(Texture.FTLinearMipmapLinear)
         self.room2.setScale(10)
         self.room2.setTexScale(TextureStage.getDefault(), 10)
         self.room2.reparentTo(level1)
         self.room2.setY(self.room1, -20)
+        if self.generatedWaypoints:
+            self.room2waypoints = PathFinder.loadRoomWaypoints("rooms/room2.egg", self.room2)
+        else:
+            execfile("rooms/room2.py")
+        PathFinder.loadWaypointGraph(self.room2waypoints)
         self.room2.find("**/Cube*;+h").setTag("Room", "2")
+        PathFinder.registerWalls(self.room2.find("**/Cube*;+h"))
         
         self.keyNest2 = self.room2.attachNewNode("key nest 2")
         keyNest.instanceTo(self.keyNest2)
@@ -304,8 +329,6 @@ class World(DirectObject):
         # he also thinks that the above comment is very useful
         # TODO: fix this hack by re-creating room3 in blender
         
-        execfile("rooms/room3.py")
-        
         room3Model = loader.loadModel("rooms/room3")
         room3Model.findTexture("*").setMinfilter(Texture.FTLinearMipmapLinear)
         room3Model.setH(90)
@@ -317,7 +340,13 @@ class World(DirectObject):
         self.room3.setTexScale(TextureStage.getDefault(), 10)
         self.room3.reparentTo(level1)
         self.room3.setX(self.room1, 20)
+        if self.generatedWaypoints:
+            self.room3waypoints = PathFinder.loadRoomWaypoints("rooms/room3.egg", room3Model)
+        else:
+            execfile("rooms/room3.py")
+        PathFinder.loadWaypointGraph(self.room3waypoints)
         self.room3.find("**/Cube*;+h").setTag("Room", "3")
+        PathFinder.registerWalls(self.room3.find("**/Cube*;+h"))
         
         
         self.keyNest3 = self.room3.attachNewNode("room 3 keynest") 
@@ -369,30 +398,36 @@ class World(DirectObject):
         def orderNPC(parameters, entry):
             
             if(parameters == "ralph has entered room 1"):
+                self.wakeRoom(self.room1)
                 self.__room1NPC.handleTransition("playerEnteredRoom")
                 self.reComputeHUD(self.room1)
                 if self.__mainAgent.hasKey(self.room1Key):
                     self.__mainAgent.setCurrentKey(self.room1Key)
             elif(parameters == "ralph has left room 1"):
                 self.__room1NPC.handleTransition("playerLeftRoom")
+                self.aiScheduler.playerLeftRoom(self.room1)
                 if self.__mainAgent.hasKey(self.room1Key):
                     self.__mainAgent.setCurrentKey(None)
             elif(parameters == "ralph has entered room 2"):
+                self.wakeRoom(self.room2)
                 self.__room2NPC.handleTransition("playerEnteredRoom")
                 self.reComputeHUD(self.room2)
                 if self.__mainAgent.hasKey(self.room2Key):
                     self.__mainAgent.setCurrentKey(self.room2Key)
             elif(parameters == "ralph has left room 2"):
                 self.__room2NPC.handleTransition("playerLeftRoom")
+                self.aiScheduler.playerLeftRoom(self.room2)
                 if self.__mainAgent.hasKey(self.room2Key):
                     self.__mainAgent.setCurrentKey(None)
             elif(parameters == "ralph has entered room 3"):
+                self.wakeRoom(self.room3)
                 self.__room3NPC.handleTransition("playerEnteredRoom")
                 if self.__mainAgent.hasKey(self.room3Key):
                     self.__mainAgent.setCurrentKey(self.room3Key)
                 self.reComputeHUD(self.room3)
             elif(parameters == "ralph has left room 3"):
                 self.__room3NPC.handleTransition("playerLeftRoom")
+                self.aiScheduler.playerLeftRoom(self.room3)
                 if self.__mainAgent.hasKey(self.room3Key):
                     self.__mainAgent.setCurrentKey(None)
             elif(parameters == "NPC1 bumped into wall"):
@@ -416,6 +451,19 @@ class World(DirectObject):
 
         #messenger.toggleVerbose()
         self.gate = gate
+
+        # The rooms are all in place now, so we can flatten their walls and work out which waypoints can see each other
+        PathFinder.loadWalls()
+        if self.useWallMap:
+            PathFinder.enableWallMap([self.room1waypoints, self.room2waypoints, self.room3waypoints])
+        PathFinder.loadVisibility(self.room1waypoints)
+        PathFinder.loadVisibility(self.room2waypoints)
+        PathFinder.loadVisibility(self.room3waypoints)
+        PathFinder.loadNavMesh(self.room1waypoints, self.room1, "rooms/room1.nav")
+        PathFinder.loadNavMesh(self.room2waypoints, self.room2, "rooms/room2.nav")
+        PathFinder.loadNavMesh(self.room3waypoints, room3Model, "rooms/room3.nav")
+        # The NPCs are bound to their rooms, so nothing plans across them yet. Whatever does can
+        # join the rooms for PathFinder.crossRoomPath with PathFinder.addGate(gateTo2, ...) and so on.
         
 
     __globalAgentList = []
@@ -437,7 +485,7 @@ class World(DirectObject):
         # Make it visible
         self.__mainAgent.reparentTo(render)
         self.__mainAgent.setPos(31, 35, 50)
-        self.gate.find("**/Cube;+h").setCollideMask(~self.__mainAgent.collisionMask)
+        self.gate.find("**/Cube;+h").setCollideMask(~self.__mainAgent.collisionMask & ~PathFinder.getWallCollideMask())
         
     __targetCount = 0
     __targets = []
@@ -450,6 +498,7 @@ class World(DirectObject):
         modelStanding = "models/eve"
         modelRunning = "models/eve-run"
         modelWalking = "models/eve-walk"
+        randomStreams = RandomStreams(self.randomSeed)
         self.__room1NPC = NPC(modelStanding, 
                                 {"run":modelRunning, "walk":modelWalking},
                                 turnRate = 150, 
@@ -465,7 +514,8 @@ class World(DirectObject):
                                 massKg = 35.0,
                                 collisionHandler = self.physicsCollisionHandler,
                                 collisionTraverser = self.cTrav,
-                                waypoints = self.room1waypoints)
+                                waypoints = self.room1waypoints,
+                                randomStream = randomStreams.next())
         self.__room1NPC.setFluidPos(render, 0, 0, 10)
         self.__room1NPC.setScale(render, 1)
         self.__room1NPC.setPlayer(self.__mainAgent)
@@ -502,7 +552,8 @@ class World(DirectObject):
                                 massKg = 35.0,
                                 collisionHandler = self.physicsCollisionHandler,
                                 collisionTraverser = self.cTrav,
-                                waypoints = self.room2waypoints)
+                                waypoints = self.room2waypoints,
+                                randomStream = randomStreams.next())
         self.__room2NPC.setPos(-20, -210, 10)
         self.__room2NPC.setPlayer(self.__mainAgent)
         self.__room2NPC.reparentTo(render)
@@ -525,7 +576,8 @@ class World(DirectObject):
                                 massKg = 35.0,
                                 collisionHandler = self.physicsCollisionHandler,
                                 collisionTraverser = self.cTrav,
-                                waypoints = self.room3waypoints)
+                                waypoints = self.room3waypoints,
+                                randomStream = randomStreams.next())
         self.__room3NPC.setPos(210, 0, 10)
         self.__room3NPC.setPlayer(self.__mainAgent)
         self.__room3NPC.reparentTo(render)
@@ -544,6 +596,49 @@ class World(DirectObject):
         
 
     
+    def agentGridTask(self, task):
+        """Puts every agent in the spatial hash where it is this frame."""
+        items = []
+        for agent in self.__globalAgentList:
+            position = agent.getPos(render)
+            items.append((agent, (position.getX(), position.getY(), position.getZ())))
+        self.sensorGrid.update(items)
+        return Task.cont
+
+    def aiTask(self, task):
+        """
+        Runs the NPCs the AI scheduler says are due this frame: their radars in one
+        sweep, then sense and act for each, then the steering for all that moved.
+        """
+        ticks = self.aiScheduler.update(taskTimer.elapsedTime)
+        NPC.radarSweep([npc for npc, elapsedTime, missedFrames in ticks])
+        for npc, elapsedTime, missedFrames in ticks:
+            #Only NPCs that were wandering catch up
+            npc.catchUpWander(missedFrames)
+            #A throttled NPC's tick covers several frames, but NPC.getElapsedTime caps how far it turns and moves
+            npc.elapsedTime = elapsedTime
+            npc.sense(task)
+        for npc, elapsedTime, missedFrames in ticks:
+            npc.act(task)
+        if self.steering is not None:
+            NPC.steerAll(self.steering)
+        return Task.cont
+
+    def wakeRoom(self, room):
+        """
+        Makes room's NPCs tick every frame again, caught up on the wandering they missed
+        while the player was away. Call it before they hear that the player came in.
+        """
+        for npc, missedFrames in self.aiScheduler.playerEnteredRoom(room):
+            npc.catchUpWander(missedFrames)
+
+    def pathStatsTask(self, task):
+        """Closes the path finder's numbers for this frame and shows them if asked."""
+        PathFinder.pathStatsTask(task)
+        if(self.showPathStats):
+            self.pathStatsText.setText(PathFinder.formatStats())
+        return Task.cont
+
     def __setupTasks(self):
         """
         This function sets up all the tasks used in the world
@@ -571,15 +666,25 @@ class World(DirectObject):
           #  taskMgr.add(self.__mainAgent.handleCollisionTask, "handleCollisionTask")
 ##        taskMgr.add(self.ralph.wanderTask, "wander")
         
-        taskMgr.add(self.__room1NPC.sense, "senseTask")
-        taskMgr.add(self.__room2NPC.sense, "senseTask")
-        taskMgr.add(self.__room3NPC.sense, "senseTask")
+        for npc in (self.__room1NPC, self.__room2NPC, self.__room3NPC):
+            npc.batchedRadar = True
+            npc.sensorGrid = self.sensorGrid
+        taskMgr.add(self.agentGridTask, "agentGridTask")
+        # Senses, acts and steers the NPCs, each as often as its room needs
+        self.aiScheduler = AIScheduler(self.aiInactiveRate, self.aiSleepInactive, isBusy = NPC.isBusy)
+        self.aiScheduler.addNPC(self.__room1NPC, self.room1)
+        self.aiScheduler.addNPC(self.__room2NPC, self.room2)
+        self.aiScheduler.addNPC(self.__room3NPC, self.room3)
+        # Without numpy the NPCs go on steering themselves in act
+        self.steering = NPC.createSteering([self.__room1NPC, self.__room2NPC, self.__room3NPC])
+        taskMgr.add(self.aiTask, "aiTask")
 ##        taskMgr.add(self.ralph.think, "thinkTask")
-        taskMgr.add(self.__room1NPC.act, "actTask")
-        taskMgr.add(self.__room2NPC.act, "actTask")
-        taskMgr.add(self.__room3NPC.act, "actTask")
+        taskMgr.add(PathFinder.pathSchedulerTask, "pathSchedulerTask")
+        taskMgr.add(PathFinder.pathServiceTask, "pathServiceTask")
+        taskMgr.add(PathFinder.flowFieldTask, "flowFieldTask")
         taskMgr.add(self.checkGameState, "gameStateTask")
         taskMgr.add(self.animateItems, "animateItemsTask")
+        taskMgr.add(self.pathStatsTask, "pathStatsTask")
         #taskMgr.add(self.processKey, "processKeyTask")
 
         # This is for path finding
@@ -703,9 +808,23 @@ class World(DirectObject):
             self.showCollisions = not self.showCollisions
             print("showCollisions = " + str(self.showCollisions))
             
+        def togglePathStats(key):
+            self.showPathStats = not self.showPathStats
+            PathFinder.enableStats(self.showPathStats)
+            if(self.showPathStats):
+                self.pathStatsText.show()
+            else:
+                self.pathStatsText.hide()
+            print("showPathStats = " + str(self.showPathStats))
+            
+        self.pathStatsText = OnscreenText(text="", style=1, fg=(1,1,1,1), pos=(-1.3,.9),
+                            align=TextNode.ALeft, scale = .04, mayChange = True)
+        self.pathStatsText.hide()
+            
         self.accept("p",              togglePathSmoothening, ["togglePathSmoothening"])
         self.accept("w",              toggleWaypoints, ["toggleWaypoints"])
         self.accept("c",              toggleCollisions, ["toggleCollisions"])
+        self.accept("i",              togglePathStats, ["togglePathStats"])
         self.accept("1", self.cameraRoom1Pos)
         self.accept("2", self.cameraRoom2Pos)
         self.accept("3", self.cameraRoom3Pos)